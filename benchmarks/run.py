@@ -0,0 +1,112 @@
+"""Run the benchmark workloads and compare them with a stored baseline.
+
+    python -m benchmarks.run                 # report ops/sec and sizes
+    python -m benchmarks.run --save          # store results as the baseline
+    python -m benchmarks.run --compare       # fail on regressions
+
+Baselines are machine specific, so save one on the machine that compares
+against it."""
+import argparse
+import json
+import os
+import sys
+import time
+
+from .workloads import BACKENDS, WORKLOADS
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+
+def measure(run, ops, duration, repeat=3, setup=None):
+    """Best operations per second over `repeat` timings of at least
+    `duration` seconds each, and the last size `run` returned.  `setup` is
+    called before every call of `run`, outside the timing"""
+    best, size = 0.0, None
+    for _ in xrange(repeat):
+        calls, elapsed = 0, 0.0
+        while True:
+            if setup is not None:
+                setup()
+            start = time.time()
+            result = run()
+            elapsed += time.time() - start
+            if result is not None:
+                size = result
+            calls += 1
+            if elapsed >= duration:
+                break
+        best = max(best, calls * ops / max(elapsed, 1e-9))
+    return best, size
+
+
+def run_benchmarks(duration=0.5, repeat=3, names=None, backends=None):
+    results = {}
+    for name, make in WORKLOADS.iteritems():
+        if names and name not in names:
+            continue
+        for backend, field_cls in BACKENDS.iteritems():
+            if backends and backend not in backends:
+                continue
+            run, ops, setup = (make(field_cls) + (None,))[:3]
+            ops_per_sec, size = measure(run, ops, duration, repeat, setup)
+            results['{}[{}]'.format(name, backend)] = {
+                'ops_per_sec': ops_per_sec, 'size': size
+            }
+    return results
+
+
+def regressions(results, baseline, threshold):
+    """Benchmarks more than `threshold` (a fraction) slower than baseline"""
+    slower = []
+    for key, result in sorted(results.iteritems()):
+        if key not in baseline:
+            continue
+        expected = baseline[key]['ops_per_sec']
+        if result['ops_per_sec'] < expected * (1 - threshold):
+            slower.append((key, expected, result['ops_per_sec']))
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('names', nargs='*', help='workloads to run')
+    parser.add_argument('--backend', action='append', dest='backends',
+                        choices=list(BACKENDS))
+    parser.add_argument('--duration', type=float, default=0.5)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save', action='store_true')
+    parser.add_argument('--compare', action='store_true')
+    parser.add_argument('--threshold', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.duration, args.repeat, args.names,
+                             args.backends)
+    for key, result in sorted(results.iteritems()):
+        size = result['size']
+        print('{:<32} {:>14.1f} ops/s {:>12}'.format(
+            key, result['ops_per_sec'],
+            '' if size is None else '{} B'.format(size)))
+
+    if args.save:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.baseline) as f:
+            slower = regressions(results, json.load(f), args.threshold)
+        for key, expected, actual in slower:
+            print('REGRESSION {}: {:.1f} ops/s, baseline {:.1f}'.format(
+                key, actual, expected))
+        if slower:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,223 @@
+"""Workloads for the hot paths of blocked.
+
+Every workload is a function taking a field class and returning a callable
+to time together with the number of operations one call performs, and
+optionally a callable run untimed before each call to set up its state.  A
+call may return the approximate size in bytes of what it built (see
+`deep_size`, this is not a measure of peak memory use), which the runner
+reports alongside the speed.  All workloads run against every backend in
+`BACKENDS`."""
+import random
+import sys
+from collections import OrderedDict
+from cStringIO import StringIO
+
+from blocked.bitfield import BitField
+from blocked.blocks import TBlock, UniformBlockSource
+from blocked.engine import Engine, GameState
+from blocked.field import Field
+from blocked.moves import placements, execute
+
+BACKENDS = OrderedDict([('list', Field), ('bit', BitField)])
+WORKLOADS = OrderedDict()
+
+
+def workload(func):
+    WORKLOADS[func.__name__] = func
+    return func
+
+
+def garbage_str(h, w, seed, filled=0.5, density=0.7, solid=2):
+    """Field string with the lower part randomly filled and solid rows at
+    the bottom, with a hole in every row so that none are complete"""
+    rng = random.Random(seed)
+    rows = []
+    for j in xrange(h):
+        if j >= h - solid:
+            rows.append(['3'] * w)
+        elif j >= h * (1 - filled):
+            row = ['2' if rng.random() < density else '0' for _ in xrange(w)]
+            row[rng.randrange(w)] = '0'
+            rows.append(row)
+        else:
+            rows.append(['0'] * w)
+    return ';'.join(','.join(row) for row in rows)
+
+
+def deep_size(obj, seen=None):
+    """Approximate bytes held by an object and everything it refers to"""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen)
+                    for k, v in obj.iteritems())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item, seen) for item in obj)
+    if hasattr(obj, '__dict__'):
+        size += deep_size(obj.__dict__, seen)
+    for slot in getattr(type(obj), '__slots__', ()):
+        if hasattr(obj, slot):
+            size += deep_size(getattr(obj, slot), seen)
+    return size
+
+
+@workload
+def can_place(field_cls):
+    field = field_cls.from_str(garbage_str(20, 10, 1))
+    block = TBlock(field, (4, -1))
+    positions = [(x, y) for x in xrange(-1, 10) for y in xrange(-2, 20)]
+
+    def run():
+        for x, y in positions:
+            block._can_place(x, y)
+    return run, len(positions)
+
+
+@workload
+def drop(field_cls):
+    field = field_cls.from_str(garbage_str(20, 10, 2))
+
+    def run():
+        for x in xrange(8):
+            block = TBlock(field, (x, -1))
+            block.drop()
+            block._remove()
+    return run, 8
+
+
+@workload
+def remove_completed_rows(field_cls):
+    h, w = 20, 10
+    field = field_cls.from_str(garbage_str(h, w, 3))
+    rows = range(h // 2 - 4, h // 2)
+
+    def run():
+        for j in rows:
+            for i in xrange(w):
+                field[j][i] = 2
+        field.remove_completed_rows()
+    return run, 1
+
+
+@workload
+def from_str(field_cls):
+    s = garbage_str(20, 10, 4)
+
+    def run():
+        field_cls.from_str(s)
+    return run, 1
+
+
+@workload
+def from_str_cells(field_cls):
+    """`from_str` reading every cell, as it did before it read rows whole,
+    to compare it with"""
+    s = garbage_str(20, 10, 4)
+
+    def run():
+        field_cls._from_cells(s)
+    return run, 1
+
+
+@workload
+def from_str_large(field_cls):
+    s = garbage_str(200, 60, 5)
+
+    def run():
+        field_cls.from_str(s)
+    return run, 1
+
+
+@workload
+def complete_round(field_cls):
+    field_strs = garbage_str(20, 10, 6), garbage_str(20, 10, 7)
+    engines = []
+
+    def setup():
+        fields = tuple(field_cls.from_str(s) for s in field_strs)
+        engines[:] = [Engine(fields, ('p1', 'p2'),
+                             game_state=GameState(UniformBlockSource(0)))]
+
+    def run():
+        engines[0].complete_round()
+    return run, 1, setup
+
+
+@workload
+def report(field_cls):
+    fields = (field_cls.from_str(garbage_str(20, 10, 9)),
+              field_cls.from_str(garbage_str(20, 10, 10)))
+    game_state = GameState(UniformBlockSource(0))
+    game_state.round = 2
+    engine = Engine(fields, ('player1', 'player2'),
+                    game_state=game_state)
+
+    def run():
+        engine.report_to(StringIO())
+    return run, 1
+
+
+def _random_game(field_cls, h, w, seed, max_rounds=200):
+    rng = random.Random(seed)
+    fields = field_cls(h, w), field_cls(h, w)
+    game_state = GameState(UniformBlockSource(seed))
+    game_state.block_position = w // 2 - 1, -1
+    engine = Engine(fields, ('p1', 'p2'), game_state=game_state,
+                    max_rounds=max_rounds)
+    finished = False
+    while not finished:
+        moves = []
+        for field in fields:
+            options = placements(field, game_state.current_block,
+                                 game_state.block_position)
+            moves.append(rng.choice(options).moves if options else None)
+        finished = engine.step(*moves).finished
+    return deep_size(fields)
+
+
+@workload
+def random_game(field_cls):
+    seeds = iter(xrange(sys.maxint))
+
+    def run():
+        return _random_game(field_cls, 20, 10, next(seeds))
+    return run, 1
+
+
+@workload
+def random_game_large(field_cls):
+    seeds = iter(xrange(sys.maxint))
+
+    def run():
+        return _random_game(field_cls, 40, 20, next(seeds), max_rounds=100)
+    return run, 1
+
+
+@workload
+def place_and_restore(field_cls):
+    field = field_cls.from_str(garbage_str(20, 10, 8))
+    options = placements(field, TBlock, (4, -1))
+
+    def run():
+        for option in options:
+            snapshot = TBlock.place(field, *option[:3])
+            field.remove_completed_rows()
+            field.restore(snapshot)
+    return run, len(options)
+
+
+@workload
+def execute_moves(field_cls):
+    field = field_cls.from_str(garbage_str(20, 10, 11))
+    answers = [','.join(option.moves)
+               for option in placements(field, TBlock, (4, -1))]
+
+    def run():
+        for answer in answers:
+            snapshot = field.snapshot()
+            execute(field, TBlock, (4, -1), answer)
+            field.restore(snapshot)
+    return run, len(answers)
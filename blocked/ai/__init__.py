@@ -0,0 +1 @@
+from .search import SearchBot, SearchStats, Weights, DEFAULT_WEIGHTS
@@ -0,0 +1,298 @@
+"""Book of placements keyed by the surface of the stack.
+
+Fields which differ only below the surface of the stack mostly share their
+best placement, so the book stores one placement per surface profile (the
+height of each column above the lowest, clamped) and pair of current and
+next block types.  The lower the clamp the fewer profiles there are, and
+with the default of 2 a book made from a few games covers a good part of
+the fields met in play.  Books are made offline by searching a field of each
+profile with `SearchBot`, over profiles collected from self-play and
+searched in a pool of worker processes.
+
+A book file is a header followed by fixed size entries sorted by key, and
+is memory mapped on the first lookup, which is a binary search.  A
+placement found is turned into moves (turns, then sideways moves, then a
+drop) checked against the field, and `BookBot` falls back to searching
+when there is no entry or its moves cannot be made."""
+import argparse
+import mmap
+import multiprocessing
+import struct
+from collections import namedtuple
+
+from ..blocks import BLOCKS, BLOCK_TYPES, UniformBlockSource
+from ..engine import Engine, GameState
+from ..field import Field
+from ..moves import LEFT, RIGHT, TURN_LEFT, TURN_RIGHT, DROP
+from .search import SearchBot
+
+MAGIC = 'BLKB'
+VERSION = 1
+
+_HEADER = struct.Struct('>4sBHHI')
+_ENTRY = struct.Struct('>QBb')
+_KEY = struct.Struct('>Q')
+# Columns are stored in a signed byte and keys in 64 bits, see `book_key`
+MAX_WIDTH = 127
+
+BookStats = namedtuple('BookStats', 'entries lookups hits hit_rate')
+
+
+def surface_profile(field, clamp=2):
+    """Height of each column above the lowest column, at most `clamp`"""
+    w, h = field.w, field.h
+    heights = [0] * w
+    seen, full = 0, (1 << w) - 1
+    for j in xrange(h):
+        new = field.row(j).blocked & ~seen
+        if new:
+            for i in xrange(w):
+                if new >> i & 1:
+                    heights[i] = h - j
+            seen |= new
+            if seen == full:
+                break
+    low = min(heights)
+    return tuple(min(height - low, clamp) for height in heights)
+
+
+def book_key(profile, clamp, current, next_block):
+    """Key of a profile and the types of the current and next blocks"""
+    key = 0
+    for height in profile:
+        key = key * (clamp + 1) + height
+    count = len(BLOCK_TYPES)
+    return (key * count + BLOCK_TYPES.index(current)) * count + \
+        BLOCK_TYPES.index(next_block)
+
+
+def spawn_position(width):
+    """Where blocks are spawned on fields of the given width, as for the
+    default 10 wide fields"""
+    return width // 2 - 1, -1
+
+
+def profile_field(profile, height):
+    """A field whose columns are filled up to the heights of `profile`,
+    the lowest left empty so no row is complete"""
+    field = Field(height, len(profile))
+    for i, column in enumerate(profile):
+        for j in xrange(height - column, height):
+            field[j][i] = 2
+    return field
+
+
+def path_moves(field, block_cls, position, rotation, x):
+    """Moves bringing a block from `position` to `rotation` and column `x`
+    by turning, then moving sideways, then dropping, or None if the block
+    is stopped on the way"""
+    fits, masks = field.fits, [r.row_masks for r in block_cls.rotations]
+    cx, y = position
+    moves = []
+    if rotation == 3:
+        turns, step = [TURN_LEFT], -1
+    else:
+        turns, step = [TURN_RIGHT] * rotation, 1
+    r = 0
+    for turn in turns:
+        r = (r + step) % 4
+        if not fits(masks[r], cx, y):
+            return None
+        moves.append(turn)
+    side, dx = (RIGHT, 1) if x > cx else (LEFT, -1)
+    while cx != x:
+        cx += dx
+        if not fits(masks[r], cx, y):
+            return None
+        moves.append(side)
+    moves.append(DROP)
+    return moves
+
+
+def _search_profile(args):
+    """Entries for a profile and every pair of block types, for a pool
+    worker"""
+    profile, clamp, height, depth, beam_width = args
+    field = profile_field(profile, height)
+    position = spawn_position(len(profile))
+    bot = SearchBot(max_depth=depth, beam_width=beam_width)
+    entries = []
+    for current in BLOCK_TYPES:
+        for next_block in BLOCK_TYPES:
+            ranked = bot.rank(field, (BLOCKS[current], BLOCKS[next_block]),
+                              position)
+            if ranked:
+                placement = ranked[0][1]
+                entries.append((book_key(profile, clamp, current, next_block),
+                                placement.rotation, placement.x))
+    return entries
+
+
+def collect_profiles(games, width=10, height=20, clamp=2, seed=0,
+                     max_rounds=200):
+    """Surface profiles met in self-play between greedy searching bots,
+    most often met first"""
+    counts = {}
+    for game in xrange(games):
+        fields = Field(height, width), Field(height, width)
+        game_state = GameState(UniformBlockSource(seed + game))
+        game_state.block_position = spawn_position(width)
+        engine = Engine(fields, ('p1', 'p2'), game_state=game_state,
+                        max_rounds=max_rounds)
+        bots = SearchBot(max_depth=1), SearchBot(max_depth=1)
+        result = None
+        while result is None or not result.finished:
+            for field in fields:
+                profile = surface_profile(field, clamp)
+                counts[profile] = counts.get(profile, 0) + 1
+            result = engine.step(*[
+                bot.action(fields[p], fields[1 - p], game_state)
+                for p, bot in enumerate(bots)
+            ])
+    return sorted(counts, key=lambda p: (-counts[p], p))
+
+
+def generate(path, profiles, clamp=2, height=20, depth=2, beam_width=6,
+             processes=None):
+    """Search every profile in a pool of processes and write the book"""
+    profiles = list(profiles)
+    if not profiles:
+        raise ValueError('no profiles to make a book from')
+    width = len(profiles[0])
+    if width > MAX_WIDTH:
+        raise ValueError('fields wider than {} cells are not '
+                         'supported'.format(MAX_WIDTH))
+    if (clamp + 1) ** width * len(BLOCK_TYPES) ** 2 > 1 << 64:
+        raise ValueError('profiles of {} columns clamped to {} do not fit '
+                         'in book keys'.format(width, clamp))
+    args = [(p, clamp, height, depth, beam_width) for p in profiles]
+    pool = multiprocessing.Pool(processes)
+    try:
+        entries = [e for found in pool.imap_unordered(_search_profile, args)
+                   for e in found]
+    except BaseException:
+        pool.terminate()
+        raise
+    pool.close()
+    pool.join()
+    entries.sort()
+    with open(path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, width, clamp,
+                             len(entries)))
+        for key, rotation, x in entries:
+            f.write(_ENTRY.pack(key, rotation, x))
+    return len(entries)
+
+
+class PlacementBook(object):
+    """Read access to a book file, memory mapped when first used"""
+
+    def __init__(self, path):
+        self.path = path
+        self._data = None
+        self.lookups = self.hits = 0
+
+    def _load(self):
+        with open(self.path, 'rb') as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.width, self.clamp, self.entries = \
+            _HEADER.unpack_from(self._data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('{} is not a version {} placement book'.format(
+                self.path, VERSION))
+
+    def close(self):
+        if self._data is not None:
+            self._data.close()
+            self._data = None
+
+    def _find(self, key):
+        data, size, start = self._data, _ENTRY.size, _HEADER.size
+        lo, hi = 0, self.entries
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if _KEY.unpack_from(data, start + mid * size)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.entries:
+            found, rotation, x = _ENTRY.unpack_from(data, start + lo * size)
+            if found == key:
+                return rotation, x
+        return None
+
+    def placement(self, field, current, next_block):
+        """The book's (rotation, x) for a field and the block classes in play
+        and next, or None"""
+        if self._data is None:
+            self._load()
+        if field.w != self.width:
+            return None
+        return self._find(book_key(surface_profile(field, self.clamp),
+                                   self.clamp, current.type, next_block.type))
+
+    def moves(self, field, game_state):
+        """Moves for the block in play from the book, or None.  Counted as a
+        hit only when there is an entry whose moves can be made"""
+        self.lookups += 1
+        block_cls = game_state.current_block
+        found = self.placement(field, block_cls, game_state.next_block)
+        if found is None:
+            return None
+        moves = path_moves(field, block_cls, game_state.block_position,
+                           *found)
+        if moves is not None:
+            self.hits += 1
+        return moves
+
+    @property
+    def stats(self):
+        if self._data is None:
+            self._load()
+        return BookStats(self.entries, self.lookups, self.hits,
+                         self.hits / float(self.lookups)
+                         if self.lookups else 0.0)
+
+
+class BookBot(object):
+    """Plays from a placement book, searching with `fallback` (a
+    `SearchBot` by default) when the book has no move"""
+
+    def __init__(self, book, fallback=None):
+        self.book = PlacementBook(book) if isinstance(book, basestring) \
+            else book
+        self.fallback = fallback or SearchBot()
+
+    def action(self, field, opponent_field, game_state):
+        moves = self.book.moves(field, game_state)
+        if moves is None:
+            return self.fallback.action(field, opponent_field, game_state)
+        return moves
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Make a placement book from self-play surface profiles'
+    )
+    parser.add_argument('output')
+    parser.add_argument('--games', type=int, default=10,
+                        help='self-play games to collect profiles from')
+    parser.add_argument('--profiles', type=int, default=None,
+                        help='most common profiles to search, default all')
+    parser.add_argument('--width', type=int, default=10)
+    parser.add_argument('--height', type=int, default=20)
+    parser.add_argument('--clamp', type=int, default=2)
+    parser.add_argument('--depth', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--processes', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    profiles = collect_profiles(args.games, args.width, args.height,
+                                args.clamp, args.seed)[:args.profiles]
+    entries = generate(args.output, profiles, args.clamp, args.height,
+                       args.depth, processes=args.processes)
+    print('{} profiles, {} entries'.format(len(profiles), entries))
+
+
+if __name__ == '__main__':
+    main()
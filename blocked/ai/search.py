@@ -0,0 +1,242 @@
+"""Search based bot.
+
+`SearchBot` plays the block in play by searching placements of it, of the
+next block and, further ahead, of every block type that may follow.  Only
+the most promising placements at each level are searched deeper (a beam)
+and the values over unknown blocks are averaged (expectimax).  Searches of
+increasing depth run until the time per move is up, and the best placement
+found by the deepest complete search is played."""
+import time
+from collections import namedtuple
+
+from ..blocks import BLOCKS, BLOCK_TYPES
+from ..engine import _DEFAULT_SETTINGS
+from ..features import BoardFeatures
+from ..moves import placements, DROP
+from ..score import ScoreKeeper
+
+# Weights of the board features (see `blocked.features`) and of the points
+# scored on the way to a board
+Weights = namedtuple(
+    'Weights',
+    'aggregate_height max_height holes bumpiness well_depth points'
+)
+DEFAULT_WEIGHTS = Weights(-0.51, -0.1, -0.36, -0.18, -0.05, 0.76)
+
+# Depth of the deepest complete search of a move and how many placements
+# were looked at in all searches of it
+SearchStats = namedtuple(
+    'SearchStats', 'round depth nodes seconds nodes_per_second'
+)
+
+_LOST = -1e9
+_ALL_BLOCKS = tuple(BLOCKS[t] for t in BLOCK_TYPES)
+
+
+class _Timeout(Exception):
+    pass
+
+
+class _Search(object):
+    """Search of placements on `field`, whose features are followed by
+    one `BoardFeatures` through the placements and restores of the search
+    until `close`"""
+
+    def __init__(self, field, weights, beam_width, position, deadline=None,
+                 table=None):
+        self.features = BoardFeatures(field)
+        self.weights = weights
+        self.beam_width = beam_width
+        self.position = position
+        self.deadline = deadline
+        self.table = table
+        self.nodes = 0
+
+    def close(self):
+        self.features.close()
+
+    def _points(self, combo, rows):
+        keeper = ScoreKeeper(0, combo)
+        keeper.rows_removed(rows)
+        return keeper.score
+
+    def children(self, field, block_cls):
+        """The placements of a block most worth searching, best first, with
+        their value looking no further"""
+        w = self.weights
+        options = placements(field, block_cls, self.position)
+        evaluated = self.features.evaluate(block_cls, options)
+        scored = []
+        for option, f in zip(options, evaluated):
+            if f is None:
+                continue
+            self.nodes += 1
+            scored.append((
+                w.aggregate_height * f.aggregate_height +
+                w.max_height * f.max_height +
+                w.holes * f.holes +
+                w.bumpiness * f.bumpiness +
+                w.well_depth * f.well_depth +
+                w.points * self._points(field.combo, f.rows_cleared),
+                option
+            ))
+        scored.sort(key=lambda s: -s[0])
+        return scored[:self.beam_width]
+
+    def value(self, field, blocks, depth):
+        """Value of `field` with `blocks` to play next, where blocks beyond
+        those given may be of any type"""
+        table = self.table
+        if table is not None:
+            key = field.zobrist, field.combo, tuple(b.type for b in blocks)
+            value = table.get(key, depth)
+            if value is not None:
+                return value
+        if blocks:
+            value = self._best(field, blocks[0], blocks[1:], depth)
+        else:
+            value = sum(
+                self._best(field, block_cls, (), depth)
+                for block_cls in _ALL_BLOCKS
+            ) / len(_ALL_BLOCKS)
+        if table is not None:
+            table.put(key, value, depth)
+        return value
+
+    def _best(self, field, block_cls, rest, depth):
+        if self.deadline is not None and time.time() > self.deadline:
+            raise _Timeout()
+        children = self.children(field, block_cls)
+        if not children:
+            return _LOST
+        if depth == 1:
+            return children[0][0]
+        return max(self.value_after(field, block_cls, option, rest, depth - 1)
+                   for _, option in children)
+
+    def value_after(self, field, block_cls, placement, rest, depth):
+        score = field.score
+        snapshot = block_cls.place(field, placement.rotation, placement.x,
+                                   placement.y)
+        try:
+            field.remove_completed_rows()
+            return self.weights.points * (field.score - score) + \
+                self.value(field, rest, depth)
+        finally:
+            field.restore(snapshot)
+
+
+def _value_after(args):
+    """`_Search.value_after` for a pool worker, None on running out of
+    time"""
+    (field_cls, field_str, score, combo, block_type, placement, rest, depth,
+     weights, beam_width, position, deadline) = args
+    field = field_cls.from_str(field_str, ScoreKeeper(score, combo))
+    search = _Search(field, weights, beam_width, position, deadline)
+    try:
+        value = search.value_after(field, BLOCKS[block_type], placement,
+                                   tuple(BLOCKS[t] for t in rest), depth)
+    except _Timeout:
+        return None
+    finally:
+        search.close()
+    return value, search.nodes
+
+
+class SearchBot(object):
+    """Bot with the `action(field, opponent_field, game_state)` interface
+    of `blocked.tournament`.
+
+    `time_per_move` is in milliseconds, as in the game settings.  Given a
+    `pool` (such as a `multiprocessing.Pool` or `ThreadPool`) the placements
+    of the block in play are searched in parallel.  Values of positions
+    already searched are looked up in `table` (see `blocked.zobrist`), when
+    searching without a pool.  The statistics of each move are appended to
+    `stats`."""
+
+    def __init__(self, time_per_move=None, max_depth=4, beam_width=6,
+                 weights=DEFAULT_WEIGHTS, pool=None, table=None):
+        if time_per_move is None:
+            time_per_move = _DEFAULT_SETTINGS['time_per_move']
+        self.time_per_move = time_per_move
+        self.max_depth = max_depth
+        self.beam_width = beam_width
+        self.weights = weights
+        self.pool = pool
+        self.table = table
+        self.stats = []
+
+    def _rank(self, search, field, blocks, depth):
+        children = search.children(field, blocks[0])
+        if depth == 1 or not children:
+            return children
+        if self.pool is None:
+            ranked = [
+                (search.value_after(field, blocks[0], option, blocks[1:],
+                                    depth - 1), option)
+                for _, option in children
+            ]
+        else:
+            args = [
+                (type(field), str(field), field.score, field.combo,
+                 blocks[0].type, option, [b.type for b in blocks[1:]],
+                 depth - 1, search.weights, search.beam_width,
+                 search.position, search.deadline)
+                for _, option in children
+            ]
+            results = self.pool.map(_value_after, args)
+            if None in results:
+                raise _Timeout()
+            ranked = []
+            for (value, nodes), (_, option) in zip(results, children):
+                search.nodes += nodes
+                ranked.append((value, option))
+        ranked.sort(key=lambda s: -s[0])
+        return ranked
+
+    def rank(self, field, blocks, position, depth=None):
+        """(value, placement) pairs of the placements of `blocks[0]` most
+        worth searching, best first, searching `depth` (by default
+        `max_depth`) blocks ahead without a time limit"""
+        if depth is None:
+            depth = self.max_depth
+        if depth < 1:
+            raise ValueError('depth must be at least 1')
+        field = field.copy()
+        search = _Search(field, self.weights, self.beam_width, position,
+                         table=self.table)
+        try:
+            return self._rank(search, field, tuple(blocks), depth)
+        finally:
+            search.close()
+
+    def action(self, field, opponent_field, game_state):
+        start = time.time()
+        deadline = start + self.time_per_move / 1000.0
+        field = field.copy()
+        blocks = game_state.current_block, game_state.next_block
+
+        best, searched, nodes = None, 0, 0
+        for depth in xrange(1, self.max_depth + 1):
+            # The first search always completes so there is a move to play
+            search = _Search(field, self.weights, self.beam_width,
+                             game_state.block_position,
+                             deadline if depth > 1 else None, self.table)
+            try:
+                ranked = self._rank(search, field, blocks, depth)
+            except _Timeout:
+                nodes += search.nodes
+                break
+            finally:
+                search.close()
+            nodes += search.nodes
+            if not ranked:
+                break
+            best, searched = ranked[0][1], depth
+
+        seconds = time.time() - start
+        self.stats.append(SearchStats(
+            game_state.round, searched, nodes, seconds,
+            nodes / seconds if seconds else 0.0
+        ))
+        return list(best.moves) if best is not None else [DROP]
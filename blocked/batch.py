@@ -0,0 +1,197 @@
+"""Lock-step simulation of many games at once with NumPy.
+
+Each field is held as one integer bitmask of stuck cells per row plus a flag
+per row for solid rows, stacked as (games, players, rows) arrays, so placing
+blocks, clearing rows, scoring and exchanging solid rows are array operations
+over every game together.  The rules are those of `Field`, `ScoreKeeper` and
+`Engine.complete_round`."""
+import numpy as np
+
+from .blocks import BLOCKS, BLOCK_TYPES
+from .field import Field
+from .score import ScoreKeeper
+
+RUNNING, FIRST_PLAYER_WIN, SECOND_PLAYER_WIN, TIE = 0, 1, 2, 3
+
+# Row masks of every rotation of every block, padded to four rows
+_SHAPE_MASKS = np.array([
+    [list(rotation.row_masks) + [0] * (4 - len(rotation.row_masks))
+     for rotation in BLOCKS[t].rotations]
+    for t in BLOCK_TYPES
+], dtype=np.int64)
+
+
+class BatchEngine(object):
+    def __init__(self, games, height, width):
+        if width > 62:
+            raise ValueError('fields wider than 62 cells are not supported')
+        self.n, self.h, self.w = games, height, width
+        self._full = (1 << width) - 1
+        shape = games, 2, height
+        self.stuck = np.zeros(shape, dtype=np.int64)
+        self.solid = np.zeros(shape, dtype=bool)
+        self.score = np.zeros((games, 2), dtype=np.int64)
+        self.combo = np.zeros((games, 2), dtype=np.int64)
+        self.outcome = np.zeros(games, dtype=np.int8)
+        self.round = 1
+
+    @classmethod
+    def from_fields(cls, field_pairs, starting_round=1):
+        """Batch holding the state of each (field1, field2) pair"""
+        h, w = field_pairs[0][0].h, field_pairs[0][0].w
+        engine = cls(len(field_pairs), h, w)
+        engine.round = starting_round
+        for g, fields in enumerate(field_pairs):
+            for p, field in enumerate(fields):
+                engine.score[g, p] = field.score
+                engine.combo[g, p] = field.combo
+                for j in xrange(h):
+                    values = [field.row(j)[i] for i in xrange(w)]
+                    if values == [3] * w:
+                        engine.solid[g, p, j] = True
+                    elif any(v not in (0, 2) for v in values):
+                        raise ValueError(
+                            'only stuck cells and solid rows can be batched'
+                        )
+                    else:
+                        engine.stuck[g, p, j] = sum(
+                            1 << i for i, v in enumerate(values) if v
+                        )
+        return engine
+
+    def field(self, game, player, field_cls=Field):
+        """A `field_cls` instance with the current state of one field"""
+        sk = ScoreKeeper(int(self.score[game, player]),
+                         int(self.combo[game, player]))
+        return field_cls.from_str(self.field_str(game, player), sk)
+
+    def field_str(self, game, player):
+        rows = []
+        for j in xrange(self.h):
+            if self.solid[game, player, j]:
+                rows.append(','.join(['3'] * self.w))
+            else:
+                mask = int(self.stuck[game, player, j])
+                rows.append(','.join(
+                    '2' if mask >> i & 1 else '0' for i in xrange(self.w)
+                ))
+        return ';'.join(rows)
+
+    @property
+    def running(self):
+        return self.outcome == RUNNING
+
+    def _determine_winner(self, over, active):
+        """Outcome of games in `active` given which players are game over,
+        following `Engine._determine_winner`"""
+        either = active & over.any(axis=1)
+        both = over.all(axis=1)
+        p1, p2 = self.score[:, 0], self.score[:, 1]
+        outcome = np.where(
+            both,
+            np.where(p1 == p2, TIE,
+                     np.where(p1 > p2, FIRST_PLAYER_WIN, SECOND_PLAYER_WIN)),
+            np.where(over[:, 1], FIRST_PLAYER_WIN, SECOND_PLAYER_WIN)
+        )
+        self.outcome[either] = outcome[either]
+
+    def place(self, block_types, rotations, xs, ys, active=None):
+        """Fix one block per player of every running game in place.
+
+        `block_types` holds indices into `BLOCK_TYPES` per game, the other
+        arguments are (games, 2) arrays giving each player's final rotation
+        and position.  A negative rotation marks a player with nowhere to
+        place their block.  Either that or a block landing above the field
+        ends the player's game.  `active` optionally restricts the games to
+        update."""
+        active = self.running if active is None else active & self.running
+        rotations, xs, ys = (np.asarray(a) for a in (rotations, xs, ys))
+        types = np.asarray(block_types)[:, None].repeat(2, axis=1)
+        over = (rotations < 0) & active[:, None]
+        games, players = np.nonzero(active[:, None] & ~over)
+
+        t = types[games, players]
+        r = rotations[games, players]
+        x = xs[games, players][:, None]
+        y = ys[games, players][:, None]
+        # Every row of every block is checked before any is written, so a
+        # refused placement leaves the batch as it was
+        masks = _SHAPE_MASKS[t, r]
+        # Cells shifted off the left edge are outside the field, as in
+        # `BitField.fits`
+        cut = (1 << np.maximum(-x, 0)) - 1
+        shifted = np.where(x >= 0, masks << np.maximum(x, 0),
+                           masks >> np.maximum(-x, 0))
+        rows = y + np.arange(4)[None, :]
+        present = masks != 0
+        if (present & (((masks & cut) != 0) |
+                       ((shifted & ~self._full) != 0) |
+                       (rows >= self.h))).any():
+            raise ValueError('block placed outside the field')
+        above = (present & (rows < 0)).any(axis=1)
+        over[games[above], players[above]] = True
+        inside = present & (rows >= 0)
+        g = games[:, None].repeat(4, axis=1)[inside]
+        p = players[:, None].repeat(4, axis=1)[inside]
+        rows, shifted = rows[inside], shifted[inside]
+        if (self.stuck[g, p, rows] & shifted).any() or \
+                self.solid[g, p, rows].any():
+            raise ValueError('block placed over another block')
+        self.stuck[g, p, rows] |= shifted
+
+        self._determine_winner(over, active)
+
+    def complete_round(self):
+        """`Engine.complete_round` for every running game"""
+        active = self.running
+        self.round += 1
+        old_score = self.score.copy()
+
+        complete = (self.stuck == self._full) & ~self.solid
+        complete &= active[:, None, None]
+        removed = complete.sum(axis=2)
+
+        # Stable sort moves completed rows to the top, keeping the order of
+        # the rest, then the completed rows are emptied
+        order = np.argsort(~complete, axis=2, kind='mergesort')
+        self.stuck = np.take_along_axis(self.stuck, order, axis=2)
+        self.solid = np.take_along_axis(self.solid, order, axis=2)
+        cleared = np.arange(self.h)[None, None, :] < removed[:, :, None]
+        self.stuck[cleared] = 0
+
+        scored = removed > 0
+        points = np.where(removed < 4, removed, 2 * removed)
+        self.score += np.where(scored, self.combo + points, 0)
+        self.combo = np.where(scored, self.combo + 1,
+                              np.where(active[:, None], 0, self.combo))
+
+        # Rows each player sends to their opponent, so received by the other
+        sent = self.score // 4 - old_score // 4
+        incoming = sent[:, ::-1]
+
+        occupied = (self.stuck != 0) | self.solid
+        empty_top = np.where(
+            occupied.any(axis=2), occupied.argmax(axis=2), self.h
+        )
+        # As in Engine.complete_round, garbage goes a row to each side at a
+        # time and stops with the first row which overflows a field
+        never = np.iinfo(np.int64).max
+        fails_at = np.where(incoming > empty_top, empty_top + 1, never)
+        last = fails_at.min(axis=1)
+        iterations = np.where(last == never, incoming.max(axis=1), last)
+        over = (fails_at == last[:, None]) & (last != never)[:, None]
+        raised = np.minimum(np.minimum(incoming, iterations[:, None]),
+                            empty_top)
+        raised = np.where(active[:, None], raised, 0)
+        self._raise_base(raised)
+
+        self._determine_winner(over, active)
+
+    def _raise_base(self, raised):
+        source = np.arange(self.h)[None, None, :] + raised[:, :, None]
+        inside = source < self.h
+        source = np.minimum(source, self.h - 1)
+        stuck = np.take_along_axis(self.stuck, source, axis=2)
+        solid = np.take_along_axis(self.solid, source, axis=2)
+        self.stuck = np.where(inside, stuck, 0)
+        self.solid = np.where(inside, solid, True)
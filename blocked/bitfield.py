@@ -0,0 +1,201 @@
+from . import zobrist
+from .field import Field, OutOfBoundsElem
+
+
+def _digit_mask_table(digit):
+    return ''.join('1' if chr(c) == digit else '0' for c in xrange(256))
+
+
+_FALLING = _digit_mask_table('1')
+_STUCK = _digit_mask_table('2')
+_SOLID = _digit_mask_table('3')
+
+# Masks of rows read from text by their digits, as the same rows come up
+# again and again in the fields sent each round
+_digit_masks = {}
+_DIGIT_MASKS_LIMIT = 4096
+
+
+def _masks(digits):
+    """Falling, stuck and solid masks of a row's digits"""
+    try:
+        return _digit_masks[digits]
+    except KeyError:
+        if len(_digit_masks) >= _DIGIT_MASKS_LIMIT:
+            _digit_masks.clear()
+        # Reversed so that column i is bit i
+        reverse = digits[::-1]
+        masks = _digit_masks[digits] = (int(reverse.translate(_FALLING), 2),
+                                        int(reverse.translate(_STUCK), 2),
+                                        int(reverse.translate(_SOLID), 2))
+        return masks
+
+
+class BitRow(object):
+    """Row stored as one integer bitmask per cell value, bit i is column i.
+
+    Falling (1), stuck (2) and solid (3) cells are kept in separate masks so
+    completion and collision checks are single integer operations."""
+    __slots__ = ('w', 'full', 'falling', 'stuck', 'solid', 'dirty', '_str',
+                 'owner', '_hash')
+
+    def __init__(self, w, value=0):
+        self.w = w
+        self.full = (1 << w) - 1
+        self.falling = self.stuck = self.solid = 0
+        self.dirty = False
+        self._str = None
+        self.owner = None
+        self._hash = zobrist.row_hash(w, value)
+        if value:
+            self._set_mask(value, self.full)
+
+    @classmethod
+    def rows_from_digits(cls, digits, texts, owner=None):
+        """Rows whose text forms are `texts`, with `digits` the cell digits
+        of all of them one after the other, which must all be '0' to '3'.
+        Zobrist keys must have been made for the width"""
+        rows = []
+        if not texts:
+            return rows
+        w = len(digits) // len(texts)
+        full, new, append = (1 << w) - 1, BitRow.__new__, rows.append
+        for j, text in enumerate(texts):
+            row = new(cls)
+            row.w, row.full = w, full
+            row.falling, row.stuck, row.solid = _masks(digits[j * w:j * w + w])
+            row.dirty, row._str = False, text
+            row.owner, row._hash = owner, None
+            append(row)
+        return rows
+
+    @property
+    def hash(self):
+        if self._hash is None:
+            self._hash = zobrist.cells_hash(self)
+        return self._hash
+
+    def copy(self, into=None):
+        row = BitRow.__new__(type(self)) if into is None else into
+        for name in BitRow.__slots__:
+            setattr(row, name, getattr(self, name))
+        return row
+
+    def clear(self):
+        self.falling = self.stuck = self.solid = 0
+        self._str = None
+        self._hash = 0
+
+    def _set_mask(self, value, mask):
+        if value == 1:
+            self.falling |= mask
+        elif value == 2:
+            self.stuck |= mask
+        elif value == 3:
+            self.solid |= mask
+        elif value:
+            raise ValueError('Unknown cell value {}'.format(value))
+
+    def __getitem__(self, item):
+        if 0 <= item < self.w:
+            bit = 1 << item
+            if self.stuck & bit:
+                return 2
+            if self.falling & bit:
+                return 1
+            if self.solid & bit:
+                return 3
+            return 0
+        # Blocks cannot exist beyond the horizontal bounds of the field
+        return OutOfBoundsElem
+
+    def __setitem__(self, key, value):
+        if not 0 <= key < self.w:
+            raise IndexError('Cannot place block outside bounds')
+        old = self[key]
+        bit = 1 << key
+        keep = ~bit
+        self.falling &= keep
+        self.stuck &= keep
+        self.solid &= keep
+        self._set_mask(value, bit)
+        if self._hash is not None:
+            keys = zobrist.CELL_KEYS
+            self._hash ^= keys[old][key] ^ keys[value][key]
+        self._str = None
+        self.dirty = True
+
+    def __str__(self):
+        if self._str is None:
+            # Each mask read as hex puts its bits in separate digits, and
+            # the cell values add up without carries
+            digits = '{:0{}x}'.format(
+                int(bin(self.falling)[2:], 16) +
+                2 * int(bin(self.stuck)[2:], 16) +
+                3 * int(bin(self.solid)[2:], 16), self.w
+            )
+            self._str = ','.join(digits[::-1])
+        return self._str
+
+    @property
+    def blocked(self):
+        """mask of the cells a block cannot move into"""
+        return self.stuck | self.solid
+
+    def is_complete(self):
+        return (self.falling | self.stuck | self.solid) == self.full
+
+    def is_empty(self):
+        return not (self.falling | self.stuck | self.solid)
+
+
+class SolidBitRow(BitRow):
+    __slots__ = ()
+
+    def __init__(self, w):
+        super(SolidBitRow, self).__init__(w, 3)
+
+    def __setitem__(self, key, value):
+        if self.owner is None:
+            raise TypeError('Cannot write to a shared solid row')
+        super(SolidBitRow, self).__setitem__(key, value)
+
+    def is_complete(self):
+        return False
+
+
+class BitField(Field):
+    """Field with the same behaviour and text format as `Field`, backed by
+    `BitRow` so row and collision checks work on whole rows at once"""
+    row_type = BitRow
+    solid_row_type = SolidBitRow
+
+    def __init__(self, height, width, score_keeper=None):
+        super(BitField, self).__init__(height, width, score_keeper)
+        self._full = (1 << width) - 1
+
+    def fits(self, row_masks, x, y):
+        full, h = self._full, self.h
+        for j, mask in enumerate(row_masks, y):
+            if not mask:
+                continue
+            if x < 0:
+                if mask & ((1 << -x) - 1):
+                    return False
+                mask >>= -x
+            else:
+                mask <<= x
+            if mask & ~full or j >= h:
+                return False
+            # Above the field there is nothing to collide with
+            if j >= 0 and mask & self._field[j].blocked:
+                return False
+        return True
+
+    def _first_blocked(self, column, start):
+        bit = 1 << column
+        field = self._field
+        for j in xrange(max(start, 0), self.h):
+            if field[j].blocked & bit:
+                return j
+        return self.h
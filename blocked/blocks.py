@@ -1,6 +1,9 @@
+import abc
+import copy
 import functools
-import itertools
 import random
+from array import array
+from collections import namedtuple
 
 from .exceptions import InvalidBlockPosition, CannotMoveBlock, \
     InvalidBlockRotation
@@ -16,34 +19,84 @@ def movement(move_method):
     return do_move_if_possible
 
 
+# One rotation state of a block: its shape matrix, the (i, j) offsets of
+# its occupied cells and a bitmask per shape row (bit i set for column i)
+Rotation = namedtuple('Rotation', 'shape cells row_masks')
+
+rotate_ccw = lambda m: tuple(map(tuple, reversed(zip(*m))))
+rotate_cw = lambda m: tuple(map(tuple, zip(*reversed(m))))
+
+
+def _rotation(shape):
+    cells = tuple(
+        (i, j) for j, row in enumerate(shape)
+        for i, check in enumerate(row) if check
+    )
+    row_masks = tuple(
+        sum(1 << i for i, check in enumerate(row) if check) for row in shape
+    )
+    return Rotation(shape, cells, row_masks)
+
+
+def _rotation_table(shape):
+    """The four rotation states of a shape, each a quarter turn clockwise
+    from the previous one"""
+    table = []
+    for _ in xrange(4):
+        table.append(_rotation(shape))
+        shape = rotate_cw(shape)
+    return tuple(table)
+
+
 class Block(object):
     type = ''
     shape = ()
+    rotations = ()
     _position = (None, None)
 
     def __init__(self, field, starting_position=(0, -4)):
         self._field = field
         self._movable = True
+        self._rotation = 0
         self.position = starting_position
 
     def __str__(self):
         return self.type
 
+    @classmethod
+    def place(cls, field, rotation, x, y):
+        """Fix a block in `field` at a rotation and position, such as one of
+        `blocked.moves.placements`, without moving it there.  Returns a
+        snapshot of the field from before to undo the placement with
+        `field.restore`, or None if the block does not fit or would end the
+        game by landing above the field"""
+        cells = cls.rotations[rotation].cells
+        if not field.fits(cls.rotations[rotation].row_masks, x, y) or \
+                any(y + j < 0 for _, j in cells):
+            return None
+        snapshot = field.snapshot()
+        row = field.writable_row
+        for i, j in cells:
+            row(y + j)[x + i] = 2
+        field.notify_stuck(cells, x, y)
+        return snapshot
+
+    @property
+    def rotation(self):
+        """index into `rotations` of the current rotation state"""
+        return self._rotation
+
     def _iter_location(self, x, y):
-        for j, row in enumerate(self.shape):
-            for i, check in enumerate(row):
-                if check:
-                    yield x + i, y + j
+        for i, j in self.rotations[self._rotation].cells:
+            yield x + i, y + j
 
     def _can_place(self, x, y):
-        for i, j in self._iter_location(x, y):
-            if self._field[j][i] > 1:
-                return False
-        return True
+        return self._field.fits(self.rotations[self._rotation].row_masks, x, y)
 
     def _update_field(self, x, y, v):
+        row = self._field.writable_row
         for i, j in self._iter_location(x, y):
-            self._field[j][i] = v
+            row(j)[i] = v
 
     def _place(self, x, y):
         self._update_field(x, y, 1)
@@ -57,6 +110,7 @@ class Block(object):
         x, y = self._position
         self._update_field(x, y, 2)
         self._movable = False
+        self._field.notify_stuck(self.rotations[self._rotation].cells, x, y)
 
     @property
     def movable(self):
@@ -76,54 +130,83 @@ class Block(object):
     @position.setter
     @movement
     def position(self, value):
-        if self._can_place(*value):
-            self._remove()
-            self._place(*value)
-            self._position = value
-        else:
+        if not self.try_move(*value):
             raise InvalidBlockPosition(
                 "cannot place {} block at {}. \n{}"
                 .format(self.type, value, str(self._field))
             )
 
-    def _rotate(self, forward, back):
+    def try_move(self, x, y):
+        """Move the block to x, y if it fits there.  Returns whether the
+        block was moved"""
+        if not self._movable or not self._can_place(x, y):
+            return False
+        self._remove()
+        self._place(x, y)
+        self._position = x, y
+        return True
+
+    def _set_rotation(self, rotation):
+        self._rotation = rotation
+        self.shape = self.rotations[rotation].shape
+
+    def try_rotate(self, step=1):
+        """Rotate the block by `step` quarter turns clockwise (negative for
+        counter-clockwise) if it fits.  Returns whether the block rotated"""
+        if not self._movable:
+            return False
+        rotation = (self._rotation + step) % 4
+        x, y = self._position
+        if not self._field.fits(self.rotations[rotation].row_masks, x, y):
+            return False
+        self._remove()
+        self._set_rotation(rotation)
+        self._place(x, y)
+        return True
+
+    def hard_drop(self):
+        """Drop the block straight down to where it lands and fix it there.
+        Returns the final position, or None if the block cannot move"""
+        if not self._movable:
+            return None
+        x, y = self._position
+        y += self._field.drop_distance(
+            self.rotations[self._rotation].row_masks, x, y
+        )
         self._remove()
-        self.shape = forward(self.shape)
-        if not self._can_place(*self._position):
-            self.shape = back(self.shape)
-            self.position = self._position
+        self._place(x, y)
+        self._position = x, y
+        self._stick()
+        return self._position
+
+    def _rotate(self, step):
+        if not self.try_rotate(step):
             raise InvalidBlockRotation('Cannot rotate block')
-        self.position = self._position
 
     @movement
     def rotate_cw(self):
         """Try to rotate the block clockwise by a quarter turn"""
-        self._rotate(rotate_cw, rotate_ccw)
+        self._rotate(1)
         return self
 
     @movement
     def rotate_ccw(self):
         """Try to rotate the block counter-clockwise by a quarter turn"""
-        self._rotate(rotate_ccw, rotate_cw)
+        self._rotate(-1)
         return self
 
     @movement
     def drop(self):
         """Drop the block directly downwards to the bottom of the field.
         This is the block's final position and it cannot be moved further"""
-        self._remove()
-        x, y = self.position
-        for i in itertools.count():
-            if not self._can_place(x, y + i):
-                self.position = x, y + i - 1
-                break
-        self.movable = False
+        self.hard_drop()
         return self
 
 
 def _build_block_cls(letter, shape):
     return type(
-        '{}Block'.format(letter), (Block,), {'type': letter, 'shape': shape}
+        '{}Block'.format(letter), (Block,),
+        {'type': letter, 'shape': shape, 'rotations': _rotation_table(shape)}
     )
 
 
@@ -153,12 +236,125 @@ BLOCKS = {
         OBlock, IBlock, JBlock, LBlock, SBlock, TBlock, ZBlock
     )
 }
-rotate_ccw = lambda m: tuple(map(tuple, reversed(zip(*m))))
-rotate_cw = lambda m: tuple(map(tuple, zip(*reversed(m))))
+# Fixed order of block types for sources and formats which store blocks as
+# small integers
+BLOCK_TYPES = tuple(sorted(BLOCKS))
+_INDEXED_BLOCKS = tuple(BLOCKS[t] for t in BLOCK_TYPES)
 
 
-def default_block_source():
+def default_block_source(rng=random):
     blocks = BLOCKS.values()
-    choice = lambda: random.randint(0, len(blocks) - 1)
+    choice = lambda: rng.randint(0, len(blocks) - 1)
     while True:
         yield blocks[choice()]
+
+
+class BlockSource(object):
+    """Iterator of block classes with its own random state.
+
+    Sources generate block type indices (into `BLOCK_TYPES`) in bulk and
+    hand them out from a buffer, `take` returns them as an array for callers
+    that work on whole sequences.  A source can be copied with `fork` and
+    pickled, and both copies then produce the same blocks.  Subclasses
+    implement `_generate`."""
+    __metaclass__ = abc.ABCMeta
+    _chunk = 256
+
+    def __init__(self):
+        self._buffer = array('B')
+        self._pos = 0
+
+    @abc.abstractmethod
+    def _generate(self, n):
+        """At least `n` more block type indices, or fewer if the source has
+        run out"""
+
+    def _fill(self, n):
+        if len(self._buffer) - self._pos >= n:
+            return
+        self._buffer = self._buffer[self._pos:]
+        self._pos = 0
+        while len(self._buffer) < n:
+            more = self._generate(max(n - len(self._buffer), self._chunk))
+            if not more:
+                break
+            self._buffer.extend(more)
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if self._pos == len(self._buffer):
+            self._fill(1)
+            if not self._buffer:
+                raise StopIteration
+        index = self._buffer[self._pos]
+        self._pos += 1
+        return _INDEXED_BLOCKS[index]
+
+    __next__ = next
+
+    def take(self, n):
+        """The next `n` block type indices as an array"""
+        self._fill(n)
+        taken = self._buffer[self._pos:self._pos + n]
+        self._pos += len(taken)
+        return taken
+
+    def fork(self):
+        return copy.deepcopy(self)
+
+
+class UniformBlockSource(BlockSource):
+    """Every block type equally likely for each block"""
+
+    def __init__(self, seed=None):
+        super(UniformBlockSource, self).__init__()
+        self._rng = random.Random(seed)
+
+    def _generate(self, n):
+        rnd, count = self._rng.random, len(BLOCK_TYPES)
+        return array('B', [int(rnd() * count) for _ in xrange(n)])
+
+
+class BagBlockSource(BlockSource):
+    """Deals shuffled bags holding one of each block type"""
+
+    def __init__(self, seed=None):
+        super(BagBlockSource, self).__init__()
+        self._rng = random.Random(seed)
+
+    def _generate(self, n):
+        blocks = array('B')
+        while len(blocks) < n:
+            bag = range(len(BLOCK_TYPES))
+            self._rng.shuffle(bag)
+            blocks.extend(bag)
+        return blocks
+
+
+class SequenceBlockSource(BlockSource):
+    """Blocks from a fixed sequence of block types, such as 'OITZ', stopping
+    at its end unless `repeat` is set"""
+
+    def __init__(self, types, repeat=False):
+        super(SequenceBlockSource, self).__init__()
+        self._sequence = array('B', [BLOCK_TYPES.index(t) for t in types])
+        self._repeat = repeat
+        self._next = 0
+
+    @classmethod
+    def from_file(cls, path, repeat=False):
+        """Read block types from a file, ignoring whitespace and commas"""
+        with open(path) as f:
+            types = [c for c in f.read() if c not in ', \t\r\n']
+        return cls(types, repeat)
+
+    def _generate(self, n):
+        blocks = array('B')
+        sequence = self._sequence
+        while len(blocks) < n and self._next < len(sequence):
+            end = min(self._next + n - len(blocks), len(sequence))
+            blocks.extend(sequence[self._next:end])
+            self._next = 0 if self._repeat and end == len(sequence) else end
+        return blocks
@@ -0,0 +1,252 @@
+"""Training samples from self-play, streamed to memory mapped NumPy shards.
+
+A `Recorder` wraps an `Engine` and, for every block a player fixes, appends
+a sample holding the board before the block was placed, the current and
+next block types, where the block was fixed, the player's score and combo
+and, once the game is over, its outcome for that player.  Boards are packed
+to one bit per cell straight from the field's rows, cells filled by stuck
+blocks or solid rows set.
+
+A dataset is a directory of `.npy` shards of `shard_size` samples each,
+made at full size when started and filled in place, and an `index.json`
+holding the number of samples in each.  Only the shard being filled is
+open for writing, so memory use does not grow with the number of samples,
+and a writer opened on an existing dataset goes on appending to it.
+`Dataset` reads samples by index, mapping each shard only when first
+used."""
+import json
+import os
+from array import array
+
+import numpy as np
+
+from .blocks import BLOCK_TYPES
+
+UNFINISHED, WIN, LOSS, TIE = 0, 1, 2, 3
+
+INDEX = 'index.json'
+
+
+def sample_dtype(height, width):
+    """Record type of the samples of fields of the given size.  Row j of
+    `board` holds bit i of the row's mask of filled cells in bit i % 8 of
+    byte i // 8"""
+    return np.dtype([
+        ('board', np.uint8, (height, (width + 7) // 8)),
+        ('current', np.uint8),
+        ('next', np.uint8),
+        ('rotation', np.uint8),
+        ('x', np.int16),
+        ('y', np.int16),
+        ('score', np.uint32),
+        ('combo', np.uint16),
+        ('player', np.uint8),
+        ('round', np.uint32),
+        ('outcome', np.uint8),
+    ])
+
+
+def pack_board(field):
+    """The filled cells of a field, packed as in `sample_dtype`"""
+    masks = np.array([field.row(j).blocked for j in xrange(field.h)],
+                     dtype='<u8')
+    return masks.view(np.uint8).reshape(field.h, 8)[:, :(field.w + 7) // 8]
+
+
+def unpack_boards(boards, width):
+    """Boolean (..., height, width) arrays of filled cells from packed
+    boards"""
+    bits = np.unpackbits(boards[..., None], axis=-1)[..., ::-1]
+    return bits.reshape(boards.shape[:-1] + (-1,))[..., :width].astype(bool)
+
+
+def _shard_name(k):
+    return 'shard-{:05d}.npy'.format(k)
+
+
+def _read_index(directory):
+    with open(os.path.join(directory, INDEX)) as f:
+        return json.load(f)
+
+
+class DatasetWriter(object):
+    def __init__(self, directory, height, width, shard_size=1 << 16):
+        if width > 64:
+            raise ValueError('fields wider than 64 cells are not supported')
+        self.directory = directory
+        self.h, self.w = height, width
+        self.dtype = sample_dtype(height, width)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        if os.path.exists(os.path.join(directory, INDEX)):
+            index = _read_index(directory)
+            if (index['height'], index['width']) != (height, width):
+                raise ValueError('{} holds {}x{} fields'.format(
+                    directory, index['height'], index['width']))
+            self.shard_size = index['shard_size']
+            self._counts = index['counts']
+        else:
+            self.shard_size = shard_size
+            self._counts = []
+        self._shard = None
+        if self._counts and self._counts[-1] < self.shard_size:
+            self._shard = np.load(self._path(len(self._counts) - 1),
+                                  mmap_mode='r+')
+
+    def __len__(self):
+        return sum(self._counts)
+
+    def _path(self, k):
+        return os.path.join(self.directory, _shard_name(k))
+
+    def _write_index(self):
+        path = os.path.join(self.directory, INDEX)
+        with open(path + '.tmp', 'w') as f:
+            json.dump({'height': self.h, 'width': self.w,
+                       'shard_size': self.shard_size,
+                       'counts': self._counts}, f)
+        os.rename(path + '.tmp', path)
+
+    def _close_shard(self):
+        if self._shard is not None:
+            self._shard.flush()
+            self._shard = None
+            self._write_index()
+
+    def append(self, board, current, next_block, placement, score, combo,
+               player, game_round):
+        """Add a sample, with `board` from `pack_board` and block types as
+        indices into `BLOCK_TYPES`, and return its index"""
+        if self._shard is None:
+            self._shard = np.lib.format.open_memmap(
+                self._path(len(self._counts)), mode='w+', dtype=self.dtype,
+                shape=(self.shard_size,)
+            )
+            self._counts.append(0)
+        k = self._counts[-1]
+        sample = self._shard[k]
+        sample['board'] = board
+        sample['current'], sample['next'] = current, next_block
+        sample['rotation'], sample['x'], sample['y'] = placement
+        sample['score'], sample['combo'] = score, combo
+        sample['player'], sample['round'] = player, game_round
+        sample['outcome'] = UNFINISHED
+        self._counts[-1] += 1
+        if self._counts[-1] == self.shard_size:
+            self._close_shard()
+        return (len(self._counts) - 1) * self.shard_size + k
+
+    def set_outcomes(self, indices, outcomes):
+        """Set the outcome of samples already written"""
+        last = len(self._counts) - 1
+        by_shard = {}
+        for i, outcome in zip(indices, outcomes):
+            shard, k = divmod(i, self.shard_size)
+            by_shard.setdefault(shard, ([], []))
+            by_shard[shard][0].append(k)
+            by_shard[shard][1].append(outcome)
+        for shard, (ks, values) in by_shard.iteritems():
+            if shard == last and self._shard is not None:
+                self._shard['outcome'][ks] = values
+            else:
+                samples = np.load(self._path(shard), mmap_mode='r+')
+                samples['outcome'][ks] = values
+                samples.flush()
+                del samples
+
+    def recorder(self, engine):
+        return Recorder(self, engine)
+
+    def close(self):
+        if self._shard is not None:
+            self._close_shard()
+        else:
+            self._write_index()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class Recorder(object):
+    """Plays rounds through `engine.step` and appends a sample for each
+    block fixed, setting their outcome when the game ends"""
+
+    def __init__(self, writer, engine):
+        self._writer = writer
+        self._engine = engine
+        self._fields = engine.field1, engine.field2
+        # Index and player of the samples of the game so far
+        self._samples = array('L')
+        self._players = array('B')
+
+    def step(self, moves1, moves2):
+        game_state = self._engine.game_state
+        game_round = game_state.round
+        current = BLOCK_TYPES.index(game_state.current_block.type)
+        next_block = BLOCK_TYPES.index(game_state.next_block.type)
+        before = [(pack_board(f), f.score, f.combo) for f in self._fields]
+
+        result = self._engine.step(moves1, moves2)
+        for p, placement in enumerate(result.placements):
+            if placement is None:
+                continue
+            board, score, combo = before[p]
+            self._samples.append(self._writer.append(
+                board, current, next_block, placement, score, combo, p,
+                game_round
+            ))
+            self._players.append(p)
+        if result.finished:
+            self._finish(result.winner)
+        return result
+
+    def _finish(self, winner):
+        if winner is None:
+            outcomes = [TIE] * len(self._players)
+        else:
+            outcomes = [WIN if p == winner else LOSS for p in self._players]
+        self._writer.set_outcomes(self._samples, outcomes)
+        self._samples = array('L')
+        self._players = array('B')
+
+
+class Dataset(object):
+    """Read access to the samples of a dataset directory"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        index = _read_index(directory)
+        self.h, self.w = index['height'], index['width']
+        self.shard_size = index['shard_size']
+        self._counts = index['counts']
+        self._shards = [None] * len(self._counts)
+
+    def __len__(self):
+        return sum(self._counts)
+
+    def shard(self, k):
+        """The samples of shard `k`, memory mapped"""
+        if self._shards[k] is None:
+            self._shards[k] = np.load(
+                os.path.join(self.directory, _shard_name(k)), mmap_mode='r'
+            )[:self._counts[k]]
+        return self._shards[k]
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        shard, k = divmod(i, self.shard_size)
+        if not 0 <= i < len(self) or k >= self._counts[shard]:
+            raise IndexError('sample {} is not in the dataset'.format(i))
+        return self.shard(shard)[k]
+
+    def take(self, indices):
+        """The samples at `indices`, as an array"""
+        return np.array([self[i] for i in indices], dtype=self.shard(0).dtype)
+
+    def boards(self, samples):
+        """Boolean (samples, height, width) arrays of filled cells"""
+        return unpack_boards(samples['board'], self.w)
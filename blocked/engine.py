@@ -1,7 +1,8 @@
-from collections import OrderedDict
+from collections import namedtuple, OrderedDict
 
 from .blocks import default_block_source
 from .exceptions import GameOver, FirstPlayerWin, SecondPlayerWin, Tie
+from .moves import execute
 
 _DEFAULT_SETTINGS = OrderedDict([
     ('time_bank', 10000),
@@ -13,54 +14,123 @@ _DEFAULT_SETTINGS = OrderedDict([
 ])
 
 
+# Outcome of a round played by `Engine.step`.  Once the game is `finished`
+# `winner` is 0 or 1 for the player who won, or None for a tie.  Where each
+# player's block was fixed, as (rotation, x, y) or None if it ended their
+# game, and the rows cleared and garbage rows sent are given per player
+StepResult = namedtuple(
+    'StepResult', 'round finished winner placements rows_cleared garbage_sent'
+)
+
+
 class Reporter(object):
+    """Reports are rendered to a single string of bytes and written to the
+    output in one call"""
+
+    def render(self):
+        return ''
+
     def report_to(self, output):
-        pass
+        output.write(self.render())
 
 
-def _report_repr(k, v):
+def _value_repr(v):
     if isinstance(v, tuple):
-        v = ','.join(map(str, v))
-    return '{} {}'.format(k, v)
+        return ','.join(map(str, v))
+    return v
+
+
+def _report_repr(k, v):
+    return '{} {}'.format(k, _value_repr(v))
+
+
+def _escape(s):
+    return s.replace('{', '{{').replace('}', '}}')
 
 
 class SettingsReporter(Reporter):
+    """Settings do not change during a game, so they are rendered once"""
+
     def __init__(self, settings):
         super(SettingsReporter, self).__init__()
         self._settings = settings
+        self._rendered = None
 
-    def report_to(self, output):
-        for k, v in self._settings.iteritems():
-            output.write('settings {}\n'.format(_report_repr(k, v)))
+    def render(self):
+        if self._rendered is None:
+            self._rendered = ''.join([
+                'settings {}\n'.format(_report_repr(k, v))
+                for k, v in self._settings.iteritems()
+            ])
+        return self._rendered
 
 
 class GameReporter(Reporter):
     def __init__(self, game_state):
         super(GameReporter, self).__init__()
         self._game_state = game_state
+        self._template = None
 
-    def report_to(self, output):
-        for k, v in self._game_state.iteritems():
-            output.write('update game {}\n'.format(_report_repr(k, v)))
+    def render(self):
+        items = list(self._game_state.iteritems())
+        if self._template is None:
+            self._template = ''.join([
+                'update game {} {{}}\n'.format(_escape(k)) for k, _ in items
+            ])
+        return self._template.format(*[_value_repr(v) for _, v in items])
 
 
 class PlayerReporter(Reporter):
-    def __init__(self, name, field):
+    """Reports a player's points, combo and field.
+
+    With a `keyframe_interval` only the rows changed since the previous
+    report are sent, as `field_delta` followed by `index:row` pairs joined
+    with ';', and the whole field every `keyframe_interval` reports.  The
+    field's dirty rows are then tracked for this reporter alone."""
+
+    def __init__(self, name, field, keyframe_interval=None):
         self._name = name
         self._field = field
+        self._keyframe_interval = keyframe_interval
+        self._reports = 0
+        self._template = (
+            'update {name} row_points {{}}\n'
+            'update {name} combo {{}}\n'
+            'update {name} {{}}{{}}\n'
+        ).format(name=_escape(name))
+
+    def _field_report(self):
+        if self._keyframe_interval is None:
+            return 'field\n', self._field
+        dirty = self._field.take_dirty_rows()
+        keyframe = self._reports % self._keyframe_interval == 0
+        self._reports += 1
+        if keyframe:
+            return 'field\n', self._field
+        return 'field_delta\n', ';'.join(
+            '{}:{}'.format(j, self._field.row(j)) for j in dirty
+        )
+
+    def render(self):
+        kind, field = self._field_report()
+        return self._template.format(self._field.score, self._field.combo,
+                                     kind, field)
 
-    def report_to(self, output):
-        template = 'update {name} {{k}}{{v}}\n'.format(name=self._name)
-        for k, v in (('row_points ', self._field.score),
-                     ('combo ', self._field.combo),
-                     ('field\n', self._field)):
-            output.write(template.format(k=k, v=v))
+
+def apply_field_delta(field_str, delta):
+    """The field string after applying a `field_delta` report to it"""
+    rows = field_str.split(';')
+    if delta:
+        for change in delta.split(';'):
+            j, row = change.split(':')
+            rows[int(j)] = row
+    return ';'.join(rows)
 
 
 class GameState(object):
-    def __init__(self, block_source=default_block_source(), starting_round=1):
+    def __init__(self, block_source=None, starting_round=1):
         self.round = starting_round
-        self._block_source = block_source
+        self._block_source = block_source or default_block_source()
         self.current_block = self._new_block()
         self.next_block = self._new_block()
         self.block_position = 4, -1
@@ -80,56 +150,150 @@ class GameState(object):
 
 
 class Engine(Reporter):
-    def __init__(self, fields, player_names, settings=None, game_state=None):
+    """Plays out each round between two fields.
+
+    `step` plays a whole round from the moves of both players, while
+    `complete_round` only does what follows placing the blocks.  A game still
+    undecided after `max_rounds` goes to the higher score.
+
+    Given an `instrumentation` (see `blocked.instrument`) the engine times
+    `step`, `complete_round`, `report_to`, `remove_completed_rows` and
+    `raise_base` and counts the rows cleared and garbage rows sent."""
+
+    def __init__(self, fields, player_names, settings=None, game_state=None,
+                 keyframe_interval=None, instrumentation=None,
+                 max_rounds=None):
         self.field1, self.field2 = fields
         self._game_state = game_state or GameState()
         self._settings = settings or _DEFAULT_SETTINGS
+        self._max_rounds = max_rounds
 
         self._settings_reporter = SettingsReporter(settings)
         self._game_reporter = GameReporter(game_state)
-        self._p1_reporter = PlayerReporter(player_names[0], self.field1)
-        self._p2_reporter = PlayerReporter(player_names[1], self.field2)
+        self._p1_reporter = PlayerReporter(player_names[0], self.field1,
+                                           keyframe_interval)
+        self._p2_reporter = PlayerReporter(player_names[1], self.field2,
+                                           keyframe_interval)
 
-    def report_to(self, output):
+        self._instrumentation = instrumentation
+        if instrumentation is not None:
+            timed = instrumentation.timed
+            self.step = timed('step', self.step)
+            self._finish_round = timed('complete_round', self._finish_round)
+            self.report_to = timed('report_to', self.report_to)
+            self._remove_rows = timed('remove_completed_rows',
+                                      self._remove_rows)
+            self._raise_base = timed('raise_base', self._raise_base)
+
+    @property
+    def game_state(self):
+        return self._game_state
+
+    def render(self):
+        parts = [self._game_reporter.render(), self._p1_reporter.render(),
+                 self._p2_reporter.render()]
         if self._game_state.round == 1:
-            self._settings_reporter.report_to(output)
-        self._game_reporter.report_to(output)
-        self._p1_reporter.report_to(output)
-        self._p2_reporter.report_to(output)
+            parts.insert(0, self._settings_reporter.render())
+        return ''.join(parts)
 
-    def _determine_winner(self, go1, go2):
+    def _winner(self, go1, go2):
+        """0 or 1 for the player who won, None for a tie"""
         if go1 and go2:
             p1, p2 = self.field1.score, self.field2.score
             if p1 == p2:
-                return Tie()
-            return FirstPlayerWin() if p1 > p2 else SecondPlayerWin()
-        return FirstPlayerWin() if go2 else SecondPlayerWin()
+                return None
+            return 0 if p1 > p2 else 1
+        return 0 if go2 else 1
 
-    def complete_round(self):
+    def _determine_winner(self, go1, go2):
+        winner = self._winner(go1, go2)
+        if winner is None:
+            return Tie()
+        return FirstPlayerWin() if winner == 0 else SecondPlayerWin()
+
+    def _remove_rows(self, field):
+        return field.remove_completed_rows()
+
+    def _raise_base(self, field, n):
+        field.raise_base(n)
+
+    def _place(self, field, block_cls, x, y, moves):
+        """Spawn the block on the field and make the moves.  Returns where
+        the block was fixed as (rotation, x, y), or None if that ends the
+        player's game"""
+        if moves is None or not field.fits(block_cls.rotations[0].row_masks,
+                                           x, y):
+            return None
+        try:
+            return execute(field, block_cls, (x, y), moves)[:3]
+        except GameOver:
+            return None
+
+    def step(self, moves1, moves2):
+        """Play a round from each player's moves, as a list of moves or a
+        bot's comma separated answer (see `blocked.moves.compile_moves`), or
+        None for a player who gave none and so loses.  Returns a
+        `StepResult` rather than raising `GameOver`"""
+        game_state = self._game_state
+        game_round = game_state.round
+        block_cls = game_state.current_block
+        x, y = game_state.block_position
+        placements = (self._place(self.field1, block_cls, x, y, moves1),
+                      self._place(self.field2, block_cls, x, y, moves2))
+        over1, over2 = placements[0] is None, placements[1] is None
+        if over1 or over2:
+            return StepResult(game_round, True, self._winner(over1, over2),
+                              placements, (0, 0), (0, 0))
+        if self._max_rounds is not None and game_round >= self._max_rounds:
+            return StepResult(game_round, True, self._winner(True, True),
+                              placements, (0, 0), (0, 0))
+
+        cleared1, cleared2, sent1, sent2, over1, over2 = self._finish_round()
+        finished = over1 or over2
+        return StepResult(game_round, finished,
+                          self._winner(over1, over2) if finished else None,
+                          placements, (cleared1, cleared2), (sent1, sent2))
+
+    def _finish_round(self):
+        """Clear rows, exchange garbage and move on to the next round.
+        Returns the rows cleared and garbage rows sent by each player and
+        whether each has lost"""
         self._game_state.next_round()
         p1_score, p2_score = self.field1.score, self.field2.score
 
-        self.field1.remove_completed_rows()
-        self.field2.remove_completed_rows()
+        cleared1 = self._remove_rows(self.field1)
+        cleared2 = self._remove_rows(self.field2)
 
-        to_add1 = self.field1.score / 4 - p1_score / 4
-        to_add2 = self.field2.score / 4 - p2_score / 4
+        sent1 = to_add1 = self.field1.score / 4 - p1_score / 4
+        sent2 = to_add2 = self.field2.score / 4 - p2_score / 4
+        if self._instrumentation is not None:
+            self._instrumentation.count('rows_cleared', cleared1 + cleared2)
+            self._instrumentation.count('garbage_sent', to_add1 + to_add2)
 
+        # Garbage is exchanged a row to each side at a time until it is all
+        # sent or a field overflows, ending the game for that player, or for
+        # both if they overflow with the same row
+        room1, room2 = self.field1.headroom, self.field2.headroom
+        over_at1 = room1 + 1 if to_add2 > room1 else None
+        over_at2 = room2 + 1 if to_add1 > room2 else None
+        ends = [k for k in (over_at1, over_at2) if k is not None]
         game_over1 = game_over2 = False
-        while to_add1 > 0 or to_add2 > 0:
-
-            if to_add1:
-                try:
-                    self.field2.raise_base()
-                except GameOver:
-                    game_over2 = True
-                to_add1 -= 1
-            if to_add2:
-                try:
-                    self.field1.raise_base()
-                except GameOver:
-                    game_over1 = True
-                to_add2 -= 1
-
-            if game_over1 or game_over2:
-                raise self._determine_winner(game_over1, game_over2)
+        if ends:
+            end = min(ends)
+            game_over1, game_over2 = over_at1 == end, over_at2 == end
+            to_add1, to_add2 = min(to_add1, end), min(to_add2, end)
+        # Only the rows which fit are added, the row overflowing a field is
+        # not
+        to_add1, to_add2 = min(to_add1, room2), min(to_add2, room1)
+        if to_add1:
+            self._raise_base(self.field2, to_add1)
+        if to_add2:
+            self._raise_base(self.field1, to_add2)
+        return cleared1, cleared2, sent1, sent2, game_over1, game_over2
+
+    def complete_round(self):
+        """What follows both players placing their block, raising a
+        `GameOver` if the garbage sent ends the game"""
+        _, _, _, _, game_over1, game_over2 = self._finish_round()
+        if game_over1 or game_over2:
+            raise self._determine_winner(game_over1, game_over2)
@@ -0,0 +1,278 @@
+"""Board features for evaluating placements, kept up to date as the field
+changes.
+
+`BoardFeatures` listens to a `Field` and on each fixed block, cleared row
+or raised base updates the height and hole count of only the columns
+involved, so the features of the board are always at hand.  Snapshots of
+the field keep the features as they were, to be put back on restoring.
+The features a candidate placement would lead to are worked out from the
+cells it covers, falling back to a scan of the board only when the
+placement clears rows."""
+from collections import namedtuple
+
+# Heights are counted from the bottom of the field.  Bumpiness is the sum of
+# height differences between neighbouring columns and well depth the sum of
+# how far each column is below its lower neighbour, walls not counting
+Features = namedtuple(
+    'Features',
+    'aggregate_height max_height holes bumpiness well_depth rows_cleared'
+)
+
+
+def _well(c, top, w):
+    """Depth of column `c` below its lower neighbour, in terms of tops"""
+    if w == 1:
+        return 0
+    if c == 0:
+        neighbour = top(1)
+    elif c == w - 1:
+        neighbour = top(c - 1)
+    else:
+        neighbour = max(top(c - 1), top(c + 1))
+    return max(0, top(c) - neighbour)
+
+
+def _column_stats(grid, h, w):
+    """Index of the top filled cell (h if none) and number of holes of each
+    column, and the filled cells of each row, for a grid of booleans"""
+    top, holes, row_fill = [h] * w, [0] * w, [0] * h
+    for j, row in enumerate(grid):
+        for i, filled in enumerate(row):
+            if filled:
+                row_fill[j] += 1
+                if top[i] == h:
+                    top[i] = j
+            elif top[i] < j:
+                holes[i] += 1
+    return top, holes, row_fill
+
+
+def _summarise(top, holes, h, w, rows_cleared=0):
+    return Features(
+        sum(h - t for t in top),
+        h - min(top),
+        sum(holes),
+        sum(abs(top[i] - top[i + 1]) for i in xrange(w - 1)),
+        sum(_well(c, top.__getitem__, w) for c in xrange(w)),
+        rows_cleared
+    )
+
+
+class BoardFeatures(object):
+    def __init__(self, field):
+        self._field = field
+        self.h, self.w = field.h, field.w
+        self.refresh()
+        field.add_listener(self)
+
+    def close(self):
+        """Stop following changes to the field"""
+        self._field.remove_listener(self)
+
+    def _grid(self):
+        field, w = self._field, self.w
+        return [[field.row(j)[i] > 1 for i in xrange(w)]
+                for j in xrange(self.h)]
+
+    def refresh(self):
+        """Recount everything from the field.  Needed after cells have been
+        written other than by fixing blocks in place"""
+        h, w = self.h, self.w
+        self._top, self._holes, self._row_fill = \
+            _column_stats(self._grid(), h, w)
+        features = _summarise(self._top, self._holes, h, w)
+        self._aggregate = features.aggregate_height
+        self._total_holes = features.holes
+        self._bumpiness = features.bumpiness
+        self._wells = [_well(c, self._top.__getitem__, w) for c in xrange(w)]
+        self._well_depth = features.well_depth
+        self._max_height = features.max_height
+
+    @property
+    def heights(self):
+        return [self.h - t for t in self._top]
+
+    @property
+    def aggregate_height(self):
+        return self._aggregate
+
+    @property
+    def max_height(self):
+        if self._max_height is None:
+            self._max_height = self.h - min(self._top)
+        return self._max_height
+
+    @property
+    def holes(self):
+        return self._total_holes
+
+    @property
+    def bumpiness(self):
+        return self._bumpiness
+
+    @property
+    def well_depth(self):
+        return self._well_depth
+
+    @property
+    def features(self):
+        return Features(self._aggregate, self.max_height, self._total_holes,
+                        self._bumpiness, self._well_depth, 0)
+
+    def _neighbourhood(self, columns):
+        """Neighbouring column pairs and columns whose well depth depend on
+        any of `columns`"""
+        w = self.w
+        pairs, wells = set(), set()
+        for c in columns:
+            if c > 0:
+                pairs.add(c - 1)
+            if c < w - 1:
+                pairs.add(c)
+            wells.update(k for k in (c - 1, c, c + 1) if 0 <= k < w)
+        return pairs, wells
+
+    def _update_columns(self, changes):
+        """Apply new (top, holes) values for columns and update the totals
+        affected by them"""
+        top, holes = self._top, self._holes
+        pairs, wells = self._neighbourhood(changes)
+        bumpiness = sum(abs(top[i] - top[i + 1]) for i in pairs)
+        for c, (t, n) in changes.iteritems():
+            self._aggregate += top[c] - t
+            self._total_holes += n - holes[c]
+            top[c], holes[c] = t, n
+        self._bumpiness += \
+            sum(abs(top[i] - top[i + 1]) for i in pairs) - bumpiness
+        for c in wells:
+            depth = _well(c, top.__getitem__, self.w)
+            self._well_depth += depth - self._wells[c]
+            self._wells[c] = depth
+        self._max_height = None
+
+    def _add_cells(self, cells, x, y, changes, row_counts):
+        """Work out new column tops and holes for cells being filled"""
+        top, holes = self._top, self._holes
+        for i, j in cells:
+            c, r = x + i, y + j
+            row_counts[r] = row_counts.get(r, 0) + 1
+            t, n = changes.get(c) or (top[c], holes[c])
+            if r < t:
+                n += t - r - 1
+                t = r
+            else:
+                n -= 1
+            changes[c] = t, n
+
+    # Field listener interface
+
+    def on_stuck(self, cells, x, y):
+        if any(y + j < 0 for _, j in cells):
+            # The block ended the game by landing above the field
+            return
+        changes, row_counts = {}, {}
+        self._add_cells(cells, x, y, changes, row_counts)
+        for r, n in row_counts.iteritems():
+            self._row_fill[r] += n
+        self._update_columns(changes)
+
+    def on_rows_removed(self, rows):
+        h, k, first = self.h, len(rows), rows[0]
+        for r in reversed(rows):
+            del self._row_fill[r]
+        self._row_fill[:0] = [0] * k
+
+        field = self._field
+        changes = {}
+        for c, t in enumerate(self._top):
+            if t < first:
+                changes[c] = t + k, self._holes[c]
+            else:
+                # The top of the column was cleared.  The empty cells above
+                # it now lie above the first row moved down from below it,
+                # and the holes between there and the next filled cell down
+                # are no more
+                below = first + k
+                found = next(
+                    (j for j in xrange(below, h) if field.row(j)[c] > 1), h
+                )
+                changes[c] = found, self._holes[c] - (found - below)
+        self._update_columns(changes)
+
+    def on_base_raised(self, n):
+        h = self.h
+        del self._row_fill[:n]
+        self._row_fill.extend([self.w] * n)
+        self._update_columns(dict(
+            (c, (t - n if t < h else h - n, self._holes[c]))
+            for c, t in enumerate(self._top)
+        ))
+
+    def on_snapshot(self):
+        return (self._top[:], self._holes[:], self._row_fill[:],
+                self._wells[:], self._aggregate, self._total_holes,
+                self._bumpiness, self._well_depth, self._max_height)
+
+    def on_restored(self, state):
+        if state is None:
+            self.refresh()
+            return
+        top, holes, row_fill, wells = state[:4]
+        self._top, self._holes = top[:], holes[:]
+        self._row_fill, self._wells = row_fill[:], wells[:]
+        (self._aggregate, self._total_holes, self._bumpiness,
+         self._well_depth, self._max_height) = state[4:]
+
+    # Evaluating placements
+
+    def evaluate(self, block_cls, candidates):
+        """Features of the board after each candidate placement of a block,
+        given as (rotation, x, y) or `blocked.moves.Placement`.  Placements
+        ending the game by landing above the field give None"""
+        rotations = block_cls.rotations
+        return [
+            self._evaluate(rotations[c[0]].cells, c[1], c[2])
+            for c in candidates
+        ]
+
+    def _evaluate(self, cells, x, y):
+        if any(y + j < 0 for _, j in cells):
+            return None
+        changes, row_counts = {}, {}
+        self._add_cells(cells, x, y, changes, row_counts)
+        w, row_fill = self.w, self._row_fill
+        cleared = [r for r, n in row_counts.iteritems()
+                   if row_fill[r] + n == w]
+        if cleared:
+            return self._evaluate_clearing(cells, x, y, cleared)
+
+        top, holes = self._top, self._holes
+        new_top = lambda c: changes[c][0] if c in changes else top[c]
+        pairs, wells = self._neighbourhood(changes)
+        return Features(
+            self._aggregate + sum(top[c] - t for c, (t, _) in
+                                  changes.iteritems()),
+            max(self.max_height, self.h - min(t for t, _ in
+                                              changes.itervalues())),
+            self._total_holes + sum(n - holes[c] for c, (_, n) in
+                                    changes.iteritems()),
+            self._bumpiness + sum(
+                abs(new_top(i) - new_top(i + 1)) - abs(top[i] - top[i + 1])
+                for i in pairs
+            ),
+            self._well_depth + sum(
+                _well(c, new_top, w) - self._wells[c] for c in wells
+            ),
+            0
+        )
+
+    def _evaluate_clearing(self, cells, x, y, cleared):
+        h, w = self.h, self.w
+        grid = self._grid()
+        for i, j in cells:
+            grid[y + j][x + i] = True
+        for r in sorted(cleared, reverse=True):
+            del grid[r]
+        grid[:0] = [[False] * w for _ in cleared]
+        top, holes, _ = _column_stats(grid, h, w)
+        return _summarise(top, holes, h, w, len(cleared))
@@ -1,3 +1,7 @@
+import copy
+from collections import namedtuple
+
+from . import zobrist
 from .score import ScoreKeeper
 from .exceptions import GameOver
 
@@ -15,12 +19,79 @@ class _OutOfBoundsElem(object):
 OutOfBoundsElem = _OutOfBoundsElem()
 
 
+_empty = {}
+# Cell digits of the text form to cell values
+_CELL_VALUES = ''.join(chr(int(c)) if c in '0123' else '\0'
+                       for c in map(chr, xrange(256)))
+
+
+def _empty_cells(w):
+    try:
+        return _empty[w]
+    except KeyError:
+        cells = _empty[w] = '\0' * w
+        return cells
+
+
 class Row(object):
-    """Squares outside bounds can be selected but not assigned to"""
+    """Squares outside bounds can be selected but not assigned to.  Cells
+    are held in a bytearray, one byte per cell"""
 
     def __init__(self, w, value=0):
         self.w = w
-        self._row = [value] * w
+        self._row = bytearray((value,)) * w
+        self._str = None
+        self.dirty = False
+        # Zobrist hash of the cells (see `blocked.zobrist`), None until
+        # asked for in rows read from text
+        self._hash = zobrist.row_hash(w, value)
+        # Token of the field allowed to write to the row in place
+        self.owner = None
+
+    @classmethod
+    def rows_from_digits(cls, digits, texts, owner=None):
+        """Rows whose text forms are `texts`, with `digits` the cell digits
+        of all of them one after the other, which must all be '0' to '3'.
+        Zobrist keys must have been made for the width"""
+        rows = []
+        if not texts:
+            return rows
+        w = len(digits) // len(texts)
+        # Translated whole, each row takes a slice of the cells
+        cells = bytearray(digits.translate(_CELL_VALUES))
+        new, append = Row.__new__, rows.append
+        for j, text in enumerate(texts):
+            row = new(cls)
+            row.__dict__ = {
+                'w': w, '_row': cells[j * w:j * w + w], '_str': text,
+                'dirty': False, '_hash': None, 'owner': owner
+            }
+            append(row)
+        return rows
+
+    @property
+    def hash(self):
+        if self._hash is None:
+            self._hash = zobrist.cells_hash(self)
+        return self._hash
+
+    def copy(self, into=None):
+        """A copy of the row, made in the row `into` of the same type if
+        given"""
+        if into is None:
+            row = Row.__new__(type(self))
+            row.__dict__.update(self.__dict__)
+            row._row = self._row[:]
+            return row
+        into._row[:] = self._row
+        into._str, into.dirty, into._hash = self._str, self.dirty, self._hash
+        return into
+
+    def clear(self):
+        """Empty every cell"""
+        self._row[:] = _empty_cells(self.w)
+        self._str = None
+        self._hash = 0
 
     def __getitem__(self, item):
         try:
@@ -33,10 +104,22 @@ class Row(object):
             return OutOfBoundsElem
 
     def __setitem__(self, key, value):
+        if self._hash is not None:
+            keys = zobrist.CELL_KEYS
+            self._hash ^= keys[self._row[key]][key] ^ keys[value][key]
         self._row[key] = value
+        self._str = None
+        self.dirty = True
 
     def __str__(self):
-        return ','.join(map(str, self._row))
+        if self._str is None:
+            self._str = ','.join(map(str, self._row))
+        return self._str
+
+    @property
+    def blocked(self):
+        """mask of the cells a block cannot move into"""
+        return sum(1 << i for i, v in enumerate(self._row) if v > 1)
 
     def is_complete(self):
         return all(self._row)
@@ -51,63 +134,369 @@ class OutOfBoundsBottomRow(Row):
     def __getitem__(self, item):
         return OutOfBoundsElem
 
+    def __setitem__(self, key, value):
+        raise IndexError('Cannot place block outside bounds')
+
 
 class OutOfBoundsTopRow(Row):
     """Blocks can be placed in the area above the field without breaking"""
 
     def __setitem__(self, key, value):
+        if self.owner is None:
+            raise TypeError('Cannot write to a shared row above the field')
         if value > 1:
             raise GameOver('Block landing above field ended the game')
         super(OutOfBoundsTopRow, self).__setitem__(key, value)
 
 
 class SolidRow(Row):
+    """Shared between fields until written to through one of them, which
+    takes a copy of its own first"""
+
     def __init__(self, w):
         super(SolidRow, self).__init__(w, 3)
 
+    def __setitem__(self, key, value):
+        if self.owner is None:
+            raise TypeError('Cannot write to a shared solid row')
+        super(SolidRow, self).__setitem__(key, value)
+
     def is_complete(self):
         return False
 
 
+_solid_rows = {}
+_bottom_rows = {}
+_top_rows = {}
+
+
+def _bottom_row(w):
+    """Row below the field, shared by all fields of width `w`"""
+    try:
+        return _bottom_rows[w]
+    except KeyError:
+        row = _bottom_rows[w] = OutOfBoundsBottomRow(w)
+        return row
+
+
+def _top_row(w):
+    """Empty row above the field, shared by all fields of width `w` for
+    the rows they have not written to.  It has no owner, so it cannot be
+    written to in place"""
+    try:
+        return _top_rows[w]
+    except KeyError:
+        row = _top_rows[w] = OutOfBoundsTopRow(w)
+        return row
+
+# The rows of a field, the rows above it, the state of its score keeper and
+# (listener, state) pairs of its listeners at some point.  The rows are
+# shared with the field, which copies a row before writing to it
+Snapshot = namedtuple('Snapshot', 'rows hidden score listeners')
+
+
 class Field(object):
+    row_type = Row
+    solid_row_type = SolidRow
+
     def __init__(self, height, width, score_keeper=None):
         self.h, self.w = height, width
-        self._field = [Row(width) for _ in xrange(height)]
+        # Rows may be shared with snapshots and copies of the field and are
+        # only written to in place while their owner is this token
+        self._owner = object()
+        # Rows owned by the field and no longer in use, to be reused
+        self._spare = []
+        self._field = [self._new_row(self.row_type) for _ in xrange(height)]
+        # Rows above the field by index, row -1 being the last.  Falling
+        # cells are kept there as in the field, in rows made when first
+        # written to
+        self._hidden = {}
+        self._bottom = _bottom_row(width)
         self._score_keeper = score_keeper or ScoreKeeper()
+        # Rows replaced by row removal or raising since take_dirty_rows
+        self._moved = set()
+        self._listeners = []
 
     def __str__(self):
         return ';'.join(map(str, self._field))
 
+    def __eq__(self, other):
+        """Fields are equal when they have the same cells"""
+        if not isinstance(other, Field):
+            return NotImplemented
+        return (self.h, self.w) == (other.h, other.w) and \
+            self.zobrist == other.zobrist and str(self) == str(other)
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __hash__(self):
+        return self.zobrist
+
+    @property
+    def zobrist(self):
+        """Zobrist hash of the cells of the field"""
+        return zobrist.field_hash(self._field)
+
     def __getitem__(self, item):
+        """The row at `item`, safe to write to.  A row shared with a
+        snapshot or copy of the field is first replaced by a copy of its
+        own"""
+        if item < 0:
+            row, rows = self.row(item), self._hidden
+        elif item < self.h:
+            row, rows = self._field[item], self._field
+        else:
+            return self._bottom
+        if row.owner is not self._owner:
+            spare = self._spare
+            row = rows[item] = row.copy(
+                spare.pop() if spare and type(row) is self.row_type else None
+            )
+            row.owner = self._owner
+        return row
+
+    writable_row = __getitem__
+
+    def row(self, item):
+        """The row at `item` for reading only, it may be shared with
+        snapshots and copies of the field"""
         if item < 0:
-            return OutOfBoundsTopRow(self.w)
+            row = self._hidden.get(item)
+            return _top_row(self.w) if row is None else row
         if item >= self.h:
-            return OutOfBoundsBottomRow(self.w)
+            return self._bottom
         return self._field[item]
 
+    def _new_row(self, row_type):
+        if row_type is self.row_type and self._spare:
+            row = self._spare.pop()
+        else:
+            row = row_type(self.w)
+        row.owner = self._owner
+        return row
+
+    def _solid_row(self):
+        """The solid row shared by all fields of this type and width.  It
+        has no owner, so it cannot be written to in place"""
+        key = self.solid_row_type, self.w
+        try:
+            return _solid_rows[key]
+        except KeyError:
+            row = _solid_rows[key] = self.solid_row_type(self.w)
+            return row
+
+    def _release(self, row):
+        """Keep a row taken out of the field for reuse, unless it is shared
+        with a snapshot or copy"""
+        if row.owner is self._owner and type(row) is self.row_type:
+            row.clear()
+            self._spare.append(row)
+
+    def snapshot(self):
+        """Capture the cells and score of the field, and any cells above
+        it, to `restore` later.  Rows are shared rather than copied"""
+        self._owner = object()
+        return Snapshot(
+            tuple(self._field), dict(self._hidden),
+            self._score_keeper.snapshot(),
+            tuple((l, l.on_snapshot()) for l in self._listeners)
+        )
+
+    def restore(self, snapshot):
+        """Return the field to a snapshot taken from it (or from a field of
+        the same size)"""
+        field = self._field
+        for j, row in enumerate(snapshot.rows):
+            if field[j] is not row:
+                self._release(field[j])
+                field[j] = row
+                self._moved.add(j)
+        self._hidden = dict(snapshot.hidden)
+        self._owner = object()
+        self._score_keeper.restore(snapshot.score)
+        states = dict(snapshot.listeners)
+        for listener in self._listeners:
+            listener.on_restored(states.get(listener))
+
+    def copy(self):
+        """A field with the same cells and score, sharing rows with this one
+        until either writes to them"""
+        other = copy.copy(self)
+        other._field = list(self._field)
+        other._score_keeper = ScoreKeeper(*self._score_keeper.snapshot())
+        other._moved = set(self._moved)
+        other._listeners = []
+        other._spare = []
+        other._hidden = dict(self._hidden)
+        other._owner = object()
+        self._owner = object()
+        return other
+
+    def fits(self, row_masks, x, y):
+        """True if a shape given as one bitmask per row (bit i set for column
+        i of the shape) can be placed with its top left corner at x, y"""
+        for j, mask in enumerate(row_masks, y):
+            if mask:
+                row = self.row(j)
+                i = x
+                while mask:
+                    if mask & 1 and row[i] > 1:
+                        return False
+                    mask >>= 1
+                    i += 1
+        return True
+
+    def _first_blocked(self, column, start):
+        """index of the first row from `start` down with a block in `column`,
+        or the field height if there is none"""
+        field = self._field
+        for j in xrange(max(start, 0), self.h):
+            if field[j][column] > 1:
+                return j
+        return self.h
+
+    def drop_distance(self, row_masks, x, y):
+        """How many rows a shape given as row bitmasks and placed at x, y
+        can fall before it lands"""
+        bottoms = {}
+        for j, mask in enumerate(row_masks):
+            i = 0
+            while mask:
+                if mask & 1:
+                    bottoms[i] = j
+                mask >>= 1
+                i += 1
+        return min(
+            self._first_blocked(x + i, y + j + 1) - y - j - 1
+            for i, j in bottoms.iteritems()
+        )
+
+    def add_listener(self, listener):
+        """Have `listener` told of blocks being fixed in place through
+        `on_stuck(cells, x, y)`, of rows being cleared through
+        `on_rows_removed(rows)`, of the base rising by some rows through
+        `on_base_raised(n)` and of snapshots through `on_snapshot()`, whose
+        result is handed back to `on_restored(state)` when the field is
+        restored to the snapshot (None for snapshots the listener did not
+        see)"""
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self._listeners.remove(listener)
+
+    def notify_stuck(self, cells, x, y):
+        """Called when the cells of a block, given as offsets from x, y, have
+        been fixed in place"""
+        for listener in self._listeners:
+            listener.on_stuck(cells, x, y)
+
+    def take_dirty_rows(self):
+        """Indices of the rows which have changed since the last call"""
+        dirty, self._moved = self._moved, set()
+        for j, row in enumerate(self._field):
+            if row.dirty:
+                row.dirty = False
+                dirty.add(j)
+        return sorted(dirty)
+
     def remove_completed_rows(self):
+        """Remove complete rows, moving the rows above them down.  Returns
+        the number of rows removed"""
         completed = [
             i for i, row in enumerate(self._field) if row.is_complete()
         ]
 
+        # Cleared rows are emptied and put back at the top where possible
+        field = self._field
         for i in reversed(completed):
-            del self._field[i]
-
+            self._release(field.pop(i))
         for _ in completed:
-            self._field.insert(0, Row(self.w))
+            field.insert(0, self._new_row(self.row_type))
+
+        if completed:
+            self._moved.update(xrange(completed[-1] + 1))
+            for listener in self._listeners:
+                listener.on_rows_removed(completed)
 
         if self._score_keeper is not None:
             self._score_keeper.rows_removed(len(completed))
+        return len(completed)
 
-    def raise_base(self):
-        if self._field[0].is_empty():
-            del self._field[0]
-            self._field.append(SolidRow(self.w))
-        else:
+    @property
+    def headroom(self):
+        """Number of empty rows at the top, which is how far the base can
+        be raised without ending the game"""
+        field = self._field
+        n = 0
+        while n < self.h and field[n].is_empty():
+            n += 1
+        return n
+
+    def raise_base(self, n=1):
+        """Add `n` solid rows at the bottom, moving the rest up together.
+        Raises `GameOver` if that would push a row which is not empty off
+        the top, once the base has been raised as far as it can be"""
+        field = self._field
+        k = 0
+        while k < n and k < self.h and field[k].is_empty():
+            k += 1
+        if k:
+            for row in field[:k]:
+                self._release(row)
+            del field[:k]
+            field.extend([self._solid_row()] * k)
+            self._moved.update(xrange(self.h))
+            for listener in self._listeners:
+                listener.on_base_raised(k)
+        if k < n:
             raise GameOver('Raising base has ended the game: {}'.format(self))
 
     @classmethod
     def from_str(cls, s, score_keeper=None):
+        """Field from its text form, given as `str`, `bytearray`, `buffer`
+        or `memoryview`"""
+        if isinstance(s, memoryview):
+            s = s.tobytes()
+        elif not isinstance(s, str):
+            s = str(s)
+        # Text of single digit cells is checked and translated whole and
+        # rows sliced out of it, any other text is read cell by cell
+        width = s.find(';')
+        if width < 0:
+            width = len(s)
+        stride, w = width + 1, (width + 1) // 2
+        h = (len(s) + 1) // stride
+        if (len(s) + 1) % stride or width % 2 == 0 or \
+                s[1::2] != (',' * (w - 1) + ';') * (h - 1) + ',' * (w - 1):
+            return cls._from_cells(s, score_keeper)
+        digits = s[::2]
+        if digits.translate(None, '0123'):
+            return cls._from_cells(s, score_keeper)
+
+        texts = s.split(';')
+        solid = ('3,' * w)[:-1]
+        k = h
+        while k and texts[k - 1] == solid:
+            k -= 1
+        if solid in texts[:k]:
+            # Solid rows above others are raised as the text is read
+            return cls._from_cells(s, score_keeper)
+
+        # Made without rows as they are all about to be replaced
+        field = cls(0, w, score_keeper=score_keeper)
+        field.h = h
+        zobrist.cell_keys(w)
+        rows = field._field = cls.row_type.rows_from_digits(
+            digits[:k * w], texts[:k], field._owner
+        )
+        if k < h:
+            rows.extend([field._solid_row()] * (h - k))
+        return field
+
+    @classmethod
+    def _from_cells(cls, s, score_keeper=None):
         array = [map(int, r.split(',')) for r in s.split(';')]
         h, w = len(array), len(array[0])
         field = cls(h, w, score_keeper=score_keeper)
@@ -0,0 +1,230 @@
+"""Host matches between external bot processes over the text protocol.
+
+Each bot runs as a subprocess that is sent the settings and update reports
+on its stdin followed by `action moves <time bank>`, and answers with one
+line of comma separated moves.  All bots of all matches are served from a
+single `select` loop, so many matches run together without a thread per
+bot.  A bot is given `time_per_move` more milliseconds on each request, up
+to `time_bank`; a bot which runs out of time, exits or closes its output
+loses the game."""
+import errno
+import fcntl
+import os
+import select
+import subprocess
+import time
+from collections import namedtuple, OrderedDict
+
+from .blocks import UniformBlockSource
+from .engine import Engine, GameState, SettingsReporter, GameReporter, \
+    PlayerReporter, _DEFAULT_SETTINGS
+from .field import Field
+
+# Time taken to answer one action request and the time bank left after it,
+# both in milliseconds
+MoveRecord = namedtuple('MoveRecord', 'round latency time_bank')
+MatchResult = namedtuple('MatchResult', 'winner scores rounds moves')
+
+
+def _set_non_blocking(f):
+    flags = fcntl.fcntl(f, fcntl.F_GETFL)
+    fcntl.fcntl(f, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+
+class BotProcess(object):
+    def __init__(self, command):
+        self.process = subprocess.Popen(
+            command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            shell=isinstance(command, basestring)
+        )
+        self.stdin = self.process.stdin.fileno()
+        self.stdout = self.process.stdout.fileno()
+        _set_non_blocking(self.stdin)
+        _set_non_blocking(self.stdout)
+        self.closed = False
+        self._pending = ''
+        self._partial = ''
+        self._lines = []
+
+    def send(self, data):
+        self._pending += data
+
+    @property
+    def wants_write(self):
+        return bool(self._pending) and not self.closed
+
+    def on_writable(self):
+        try:
+            written = os.write(self.stdin, self._pending)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return
+            self.closed = True
+            return
+        self._pending = self._pending[written:]
+
+    def on_readable(self):
+        try:
+            data = os.read(self.stdout, 65536)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return
+            data = ''
+        if not data:
+            self.closed = True
+            return
+        lines = (self._partial + data).split('\n')
+        self._partial = lines.pop()
+        self._lines.extend(line.strip() for line in lines)
+
+    def read_line(self):
+        return self._lines.pop(0) if self._lines else None
+
+    def stop(self):
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+        self.process.stdin.close()
+        self.process.stdout.close()
+
+
+class Match(object):
+    """A game between two bot processes.  Given an `instrumentation` (see
+    `blocked.instrument`) the engine's phases, building reports and each bot
+    response time ('bot_response') are recorded"""
+
+    def __init__(self, commands, settings=None, seed=None, max_rounds=1000,
+                 instrumentation=None):
+        self._settings = settings or _DEFAULT_SETTINGS
+        self._names = self._settings['player_names']
+        self._commands = commands
+        h, w = self._settings['field_height'], self._settings['field_width']
+        self.fields = Field(h, w), Field(h, w)
+        self.game_state = GameState(UniformBlockSource(seed))
+        self._engine = Engine(self.fields, self._names, self._settings,
+                              self.game_state,
+                              instrumentation=instrumentation,
+                              max_rounds=max_rounds)
+        self._instrumentation = instrumentation
+        if instrumentation is not None:
+            self._report = instrumentation.timed('report', self._report)
+        self._reporters = (
+            GameReporter(self.game_state),
+            PlayerReporter(self._names[0], self.fields[0]),
+            PlayerReporter(self._names[1], self.fields[1]),
+        )
+        self.bots = ()
+        self.moves = ([], [])
+        self.result = None
+        self._time_bank = [self._settings['time_bank']] * 2
+        self._sent_at = [None, None]
+        self._answers = [None, None]
+
+    @property
+    def finished(self):
+        return self.result is not None
+
+    def _report(self):
+        """The updates of the round, the same for both bots"""
+        return ''.join([reporter.render() for reporter in self._reporters])
+
+    def _request(self, now):
+        limit = self._settings['time_bank']
+        report = self._report()
+        for p, bot in enumerate(self.bots):
+            self._time_bank[p] = min(
+                self._time_bank[p] + self._settings['time_per_move'], limit
+            ) if self.game_state.round > 1 else limit
+            if self.game_state.round == 1:
+                settings = OrderedDict(self._settings)
+                settings['your_bot'] = self._names[p]
+                bot.send(SettingsReporter(settings).render())
+            bot.send('{}action moves {}\n'.format(report, self._time_bank[p]))
+            self._sent_at[p] = now
+            self._answers[p] = None
+
+    def start(self, now):
+        self.bots = tuple(BotProcess(c) for c in self._commands)
+        self._request(now)
+
+    @property
+    def deadline(self):
+        return min(
+            self._sent_at[p] + self._time_bank[p] / 1000.0
+            for p in (0, 1) if self._answers[p] is None
+        )
+
+    def poll(self, now):
+        """Collect answers and time outs, playing the round once both bots
+        have answered or run out of time"""
+        for p, bot in enumerate(self.bots):
+            if self._answers[p] is not None:
+                continue
+            line = bot.read_line()
+            latency = int((now - self._sent_at[p]) * 1000)
+            if line is not None and latency <= self._time_bank[p]:
+                self._time_bank[p] -= latency
+                if self._instrumentation is not None:
+                    self._instrumentation.record('bot_response',
+                                                 now - self._sent_at[p])
+                self._answers[p] = line
+            elif bot.closed or latency > self._time_bank[p]:
+                self._time_bank[p] = 0
+                self._answers[p] = False
+            else:
+                continue
+            self.moves[p].append(
+                MoveRecord(self.game_state.round, latency, self._time_bank[p])
+            )
+        if None not in self._answers:
+            self._play_round(now)
+
+    def _play_round(self, now):
+        result = self._engine.step(*[
+            None if answer is False else answer for answer in self._answers
+        ])
+        if not result.finished:
+            self._request(now)
+        else:
+            self.result = MatchResult(
+                result.winner,
+                (self.fields[0].score, self.fields[1].score),
+                self.game_state.round, self.moves
+            )
+            self.stop()
+
+    def stop(self):
+        for bot in self.bots:
+            bot.stop()
+
+
+def run_matches(matches):
+    """Play the matches together until all have finished, returning their
+    results in order"""
+    now = time.time()
+    for match in matches:
+        match.start(now)
+    try:
+        while True:
+            running = [m for m in matches if not m.finished]
+            if not running:
+                break
+            bots = [b for m in running for b in m.bots]
+            readers = dict((b.stdout, b) for b in bots if not b.closed)
+            writers = dict((b.stdin, b) for b in bots if b.wants_write)
+            timeout = max(0, min(m.deadline for m in running) - time.time())
+            readable, writable, _ = select.select(
+                readers.keys(), writers.keys(), [], timeout
+            )
+            for fd in writable:
+                writers[fd].on_writable()
+            for fd in readable:
+                readers[fd].on_readable()
+            now = time.time()
+            for match in running:
+                match.poll(now)
+    finally:
+        for match in matches:
+            if not match.finished:
+                match.stop()
+    return [m.result for m in matches]
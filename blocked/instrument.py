@@ -0,0 +1,135 @@
+"""Optional timing and counting of the phases of a game.
+
+An `Instrumentation` hands the time spent in named phases, and named
+counts, to its sinks.  Engines and matches given one replace their phase
+methods with timed wrappers when created, so those without one run exactly
+the code they would otherwise."""
+import bisect
+import cProfile
+import functools
+import json
+import pstats
+from collections import defaultdict, namedtuple
+from timeit import default_timer
+
+PhaseSummary = namedtuple('PhaseSummary', 'phase calls total mean p50 p99')
+
+
+class Sink(object):
+    def begin(self, phase):
+        pass
+
+    def end(self, phase, seconds):
+        pass
+
+    def count(self, name, n):
+        pass
+
+
+class Histogram(Sink):
+    """Phase times in memory, counted in buckets doubling from 1us"""
+    bounds = tuple(1e-6 * 2 ** k for k in xrange(24))
+
+    def __init__(self):
+        self.buckets = defaultdict(lambda: [0] * (len(self.bounds) + 1))
+        self.totals = defaultdict(float)
+        self.counts = defaultdict(int)
+
+    def end(self, phase, seconds):
+        self.buckets[phase][bisect.bisect_left(self.bounds, seconds)] += 1
+        self.totals[phase] += seconds
+
+    def count(self, name, n):
+        self.counts[name] += n
+
+    def percentile(self, phase, q):
+        """Upper bound of the bucket holding the `q` (0 to 1) quantile of
+        the phase's times"""
+        buckets = self.buckets[phase]
+        target = q * sum(buckets)
+        seen = 0
+        for k, n in enumerate(buckets):
+            seen += n
+            if n and seen >= target:
+                return self.bounds[k] if k < len(self.bounds) else \
+                    float('inf')
+        return 0.0
+
+    def summary(self):
+        rows = []
+        for phase in sorted(self.buckets):
+            calls = sum(self.buckets[phase])
+            rows.append(PhaseSummary(
+                phase, calls, self.totals[phase],
+                self.totals[phase] / calls if calls else 0.0,
+                self.percentile(phase, 0.5), self.percentile(phase, 0.99)
+            ))
+        return rows
+
+
+class JsonLinesSink(Sink):
+    """Writes each phase time and count as a line of JSON to `f`"""
+
+    def __init__(self, f):
+        self._f = f
+
+    def end(self, phase, seconds):
+        self._f.write(json.dumps({'phase': phase, 'seconds': seconds}) + '\n')
+
+    def count(self, name, n):
+        self._f.write(json.dumps({'count': name, 'n': n}) + '\n')
+
+
+class ProfileSink(Sink):
+    """Profiles the code run in the given phases, or in all of them"""
+
+    def __init__(self, phases=None):
+        self.profile = cProfile.Profile()
+        self._phases = phases
+        self._depth = 0
+
+    def begin(self, phase):
+        if self._phases is None or phase in self._phases:
+            if not self._depth:
+                self.profile.enable()
+            self._depth += 1
+
+    def end(self, phase, seconds):
+        if self._phases is None or phase in self._phases:
+            self._depth -= 1
+            if not self._depth:
+                self.profile.disable()
+
+    def stats(self, stream=None):
+        return pstats.Stats(self.profile, stream=stream)
+
+
+class Instrumentation(object):
+    def __init__(self, *sinks):
+        self.sinks = sinks
+
+    def timed(self, phase, func):
+        """`func` reporting the time of each call as `phase`"""
+        sinks = self.sinks
+
+        @functools.wraps(func)
+        def timed_func(*args, **kwargs):
+            for sink in sinks:
+                sink.begin(phase)
+            start = default_timer()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                seconds = default_timer() - start
+                for sink in sinks:
+                    sink.end(phase, seconds)
+        return timed_func
+
+    def record(self, phase, seconds):
+        """Report the time of a phase timed elsewhere"""
+        for sink in self.sinks:
+            sink.end(phase, seconds)
+
+    def count(self, name, n=1):
+        for sink in self.sinks:
+            sink.count(name, n)
@@ -0,0 +1,216 @@
+from collections import deque, namedtuple
+
+from .exceptions import GameOver, InvalidBlockPosition
+
+LEFT, RIGHT, TURN_LEFT, TURN_RIGHT, DOWN, DROP = MOVES = (
+    'left', 'right', 'turnleft', 'turnright', 'down', 'drop'
+)
+
+# A resting position of a block and the moves from its spawn position
+# which bring it there, ending with a drop
+Placement = namedtuple('Placement', 'rotation x y moves')
+# Where `execute` fixed a block, the number of moves which could not be made
+# and the index of the first of them (None if all were made)
+Execution = namedtuple('Execution', 'rotation x y failed first_failed')
+
+_STEPS = (
+    (TURN_RIGHT, 1, 0, 0),
+    (TURN_LEFT, -1, 0, 0),
+    (LEFT, 0, -1, 0),
+    (RIGHT, 0, 1, 0),
+    (DOWN, 0, 0, 1),
+)
+
+
+def _canonical_rotations(block_cls):
+    """For each rotation the first rotation with the same set of occupied
+    cells, and the offset from that rotation's origin to this one's"""
+    normalised = []
+    for rotation in block_cls.rotations:
+        di = min(i for i, _ in rotation.cells)
+        dj = min(j for _, j in rotation.cells)
+        cells = frozenset((i - di, j - dj) for i, j in rotation.cells)
+        normalised.append((cells, di, dj))
+    canonical = []
+    for cells, di, dj in normalised:
+        for r, (other, odi, odj) in enumerate(normalised):
+            if other == cells:
+                canonical.append((r, di - odi, dj - odj))
+                break
+    return tuple(canonical)
+
+
+_canonical_cache = {}
+
+
+def _canonical(block_cls):
+    try:
+        return _canonical_cache[block_cls]
+    except KeyError:
+        canonical = _canonical_cache[block_cls] = \
+            _canonical_rotations(block_cls)
+        return canonical
+
+
+def _moves_to(parents, state):
+    moves = []
+    while parents[state] is not None:
+        state, move = parents[state]
+        moves.append(move)
+    moves.reverse()
+    while moves and moves[-1] == DOWN:
+        moves.pop()
+    moves.append(DROP)
+    return tuple(moves)
+
+
+def placements(field, block_cls, position):
+    """Every distinct resting position a block of `block_cls` spawned at
+    `position` can reach by moving and rotating.
+
+    Placements which cover the same cells (such as the rotations of an O
+    block) are reported once, with the shortest move sequence found.  The
+    field is only read, so this can be called between moves of a game."""
+    masks = [rotation.row_masks for rotation in block_cls.rotations]
+    canonical = _canonical(block_cls)
+    fits = field.fits
+
+    x, y = position
+    start = 0, x, y
+    if not fits(masks[0], x, y):
+        return []
+
+    parents = {start: None}
+    queue = deque([start])
+    found = {}
+    result = []
+    while queue:
+        state = queue.popleft()
+        r, x, y = state
+        for move, dr, dx, dy in _STEPS:
+            nr, nx, ny = (r + dr) % 4, x + dx, y + dy
+            successor = nr, nx, ny
+            if successor not in parents and fits(masks[nr], nx, ny):
+                parents[successor] = state, move
+                queue.append(successor)
+        if not fits(masks[r], x, y + 1):
+            cr, di, dj = canonical[r]
+            key = cr, x + di, y + dj
+            if key not in found:
+                found[key] = True
+                result.append(Placement(r, x, y, _moves_to(parents, state)))
+    return result
+
+
+def apply_moves(block, moves):
+    """Apply moves to a block, ignoring any that are not possible from where
+    the block is, and drop it if the moves leave it movable.  Returns the
+    number of moves which could not be made"""
+    failed = 0
+    for move in moves:
+        x, y = block.position
+        if move == LEFT:
+            moved = block.try_move(x - 1, y)
+        elif move == RIGHT:
+            moved = block.try_move(x + 1, y)
+        elif move == DOWN:
+            moved = block.try_move(x, y + 1)
+        elif move == TURN_LEFT:
+            moved = block.try_rotate(-1)
+        elif move == TURN_RIGHT:
+            moved = block.try_rotate(1)
+        elif move == DROP:
+            moved = block.hard_drop() is not None
+        else:
+            raise ValueError('Unknown move {!r}'.format(move))
+        failed += not moved
+    if block.movable:
+        block.hard_drop()
+    return failed
+
+
+# Compiled moves are indices into MOVES, or -1 for text which is not a move
+_MOVE_CODES = dict((move, code) for code, move in enumerate(MOVES))
+_DROP_CODE = _MOVE_CODES[DROP]
+_compiled = {}
+_COMPILED_LIMIT = 4096
+
+
+def compile_moves(moves):
+    """Moves given as a bot's comma separated answer or a sequence of move
+    names, as a tuple of move codes.  Answers are compiled once and kept, as
+    bots often give the same ones"""
+    if not isinstance(moves, basestring):
+        return tuple(_MOVE_CODES.get(move, -1) for move in moves)
+    try:
+        return _compiled[moves]
+    except KeyError:
+        if len(_compiled) >= _COMPILED_LIMIT:
+            _compiled.clear()
+        codes = _compiled[moves] = tuple(
+            _MOVE_CODES.get(move.strip(), -1) for move in moves.split(',')
+        ) if moves.strip() else ()
+        return codes
+
+
+def _transition_table(block_cls):
+    """For each rotation and move code other than drop, the rotation the
+    move leads to, the change in x and y and the row masks to probe"""
+    rotations = block_cls.rotations
+    steps = dict((move, (dr, dx, dy)) for move, dr, dx, dy in _STEPS)
+    table = []
+    for r in xrange(4):
+        moves = []
+        for move in MOVES[:_DROP_CODE]:
+            dr, dx, dy = steps[move]
+            nr = (r + dr) % 4
+            moves.append((nr, dx, dy, rotations[nr].row_masks))
+        table.append(tuple(moves))
+    return tuple(table)
+
+
+_transition_cache = {}
+
+
+def execute(field, block_cls, position, moves):
+    """Spawn a block at `position`, make the moves (see `compile_moves`) and
+    fix it in `field` where it lands, the same as `apply_moves` on a new
+    block.  Only a collision check per move is made until the block lands.
+    Returns an `Execution`.
+
+    Raises `InvalidBlockPosition` if the block cannot be spawned and
+    `GameOver` if it lands above the field."""
+    try:
+        table = _transition_cache[block_cls]
+    except KeyError:
+        table = _transition_cache[block_cls] = _transition_table(block_cls)
+    fits = field.fits
+
+    r, (x, y) = 0, position
+    if not fits(block_cls.rotations[0].row_masks, x, y):
+        raise InvalidBlockPosition(
+            'cannot place {} block at {}'.format(block_cls.type, position)
+        )
+    failed, first_failed, dropped = 0, None, False
+    for k, code in enumerate(compile_moves(moves)):
+        if code == _DROP_CODE and not dropped:
+            dropped = True
+            continue
+        if code >= 0 and not dropped:
+            nr, dx, dy, masks = table[r][code]
+            if fits(masks, x + dx, y + dy):
+                r, x, y = nr, x + dx, y + dy
+                continue
+        failed += 1
+        if first_failed is None:
+            first_failed = k
+
+    rotation = block_cls.rotations[r]
+    y += field.drop_distance(rotation.row_masks, x, y)
+    if any(y + j < 0 for _, j in rotation.cells):
+        raise GameOver('Block landing above field ended the game')
+    row = field.writable_row
+    for i, j in rotation.cells:
+        row(y + j)[x + i] = 2
+    field.notify_stuck(rotation.cells, x, y)
+    return Execution(r, x, y, failed, first_failed)
@@ -0,0 +1,219 @@
+"""Compact binary replays of two player games.
+
+A replay is a header holding the game settings, followed by fixed size
+chunks.  Each chunk starts with a snapshot of both fields and their scores
+and is followed by one 5 byte record per round: the block type and each
+player's final rotation and position.  Because chunks have a fixed size the
+chunk for any round is found by arithmetic, and the fields at the start of
+any round are rebuilt from its snapshot and at most `snapshot_interval`
+rounds of records.  The last record marks the end of the game and its
+winner."""
+import itertools
+import json
+import mmap
+import struct
+from collections import OrderedDict
+
+from .blocks import BLOCKS, BLOCK_TYPES
+from .engine import Engine, GameState
+from .field import Field
+from .score import ScoreKeeper
+
+MAGIC = 'BLKR'
+VERSION = 1
+TIE = 2
+
+_HEADER = struct.Struct('>4sBIHHHH')
+_FIELD_HEADER = struct.Struct('>IIH')
+_ROUND = struct.Struct('>BHH')
+_END = 0xff
+_NO_PLACEMENT = 0xffff
+
+
+# Placements are packed in 16 bits: 2 for the rotation, 6 for x + 4 and 8
+# for y + 4, which limits the size of fields that can be replayed
+MAX_WIDTH = 59
+MAX_HEIGHT = 251
+
+
+def _pack_placement(placement):
+    if placement is None:
+        return _NO_PLACEMENT
+    rotation, x, y = placement
+    return rotation << 14 | (x + 4) << 8 | (y + 4)
+
+
+def _unpack_placement(packed):
+    if packed == _NO_PLACEMENT:
+        return None
+    return packed >> 14, (packed >> 8 & 0x3f) - 4, (packed & 0xff) - 4
+
+
+class _Layout(object):
+    def __init__(self, height, width, snapshot_interval):
+        self.h, self.w = height, width
+        self.interval = snapshot_interval
+        self.row_bytes = (width + 7) // 8
+        self.field_size = _FIELD_HEADER.size + height * self.row_bytes
+        self.snapshot_size = 2 * self.field_size
+        self.chunk_size = self.snapshot_size + snapshot_interval * _ROUND.size
+
+
+class ReplayWriter(object):
+    """Writes a replay of the game played on `fields`.
+
+    Call `record_round` once each round has been completed, then `finish`
+    with the winner (0, 1 or `TIE`) when the game ends."""
+
+    def __init__(self, f, settings, fields, first_round=1,
+                 snapshot_interval=16):
+        if fields[0].w > MAX_WIDTH:
+            raise ValueError('fields wider than {} cells are not '
+                             'supported'.format(MAX_WIDTH))
+        if fields[0].h > MAX_HEIGHT:
+            raise ValueError('fields higher than {} rows are not '
+                             'supported'.format(MAX_HEIGHT))
+        self._f = f
+        self._fields = fields
+        self._layout = _Layout(fields[0].h, fields[0].w, snapshot_interval)
+        self._rounds = 0
+        meta = json.dumps(settings.items())
+        f.write(_HEADER.pack(MAGIC, VERSION, first_round, snapshot_interval,
+                             fields[0].h, fields[0].w, len(meta)))
+        f.write(meta)
+        self._write_snapshot()
+
+    def _write_snapshot(self):
+        layout = self._layout
+        for field in self._fields:
+            rows = [field.row(j) for j in xrange(layout.h)]
+            solid = sum(1 for row in rows
+                        if all(row[i] == 3 for i in xrange(layout.w)))
+            self._f.write(_FIELD_HEADER.pack(field.score, field.combo, solid))
+            for row in rows:
+                mask = sum(1 << i for i in xrange(layout.w) if row[i] == 2)
+                self._f.write(''.join(
+                    chr(mask >> (8 * b) & 0xff)
+                    for b in xrange(layout.row_bytes)
+                ))
+
+    def record_round(self, block_cls, placements):
+        """Record the block of the round just completed and where each
+        player placed it, as (rotation, x, y) or None"""
+        self._f.write(_ROUND.pack(
+            BLOCK_TYPES.index(block_cls.type),
+            *[_pack_placement(p) for p in placements]
+        ))
+        self._rounds += 1
+        if self._rounds % self._layout.interval == 0:
+            self._write_snapshot()
+
+    def finish(self, winner):
+        self._f.write(_ROUND.pack(_END, TIE if winner is None else winner, 0))
+        self._f.flush()
+
+
+class Replay(object):
+    """Read access to a replay file, memory mapped"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.first_round, interval, h, w, meta_size = \
+            _HEADER.unpack_from(self._data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('{} is not a version {} replay'.format(
+                path, VERSION))
+        meta = self._data[_HEADER.size:_HEADER.size + meta_size]
+        self.settings = OrderedDict(
+            (k, tuple(v) if isinstance(v, list) else v)
+            for k, v in json.loads(meta)
+        )
+        self._start = _HEADER.size + meta_size
+        self._layout = layout = _Layout(h, w, interval)
+
+        chunks, rest = divmod(len(self._data) - self._start,
+                              layout.chunk_size)
+        records = chunks * interval + \
+            max(rest - layout.snapshot_size, 0) // _ROUND.size
+        self.winner = None
+        self.finished = False
+        if records:
+            kind, winner, _ = self._record(records - 1)
+            if kind == _END:
+                records -= 1
+                self.finished = True
+                self.winner = None if winner == TIE else winner
+        self.rounds = records
+
+    def close(self):
+        self._data.close()
+
+    def _offset(self, index):
+        chunk, k = divmod(index, self._layout.interval)
+        return (self._start + chunk * self._layout.chunk_size +
+                self._layout.snapshot_size + k * _ROUND.size)
+
+    def _record(self, index):
+        return _ROUND.unpack_from(self._data, self._offset(index))
+
+    def _index(self, game_round):
+        index = game_round - self.first_round
+        if not 0 <= index < self.rounds:
+            raise IndexError('round {} is not in the replay'.format(
+                game_round))
+        return index
+
+    def block(self, game_round):
+        return BLOCKS[BLOCK_TYPES[self._record(self._index(game_round))[0]]]
+
+    def placements(self, game_round):
+        _, first, second = self._record(self._index(game_round))
+        return _unpack_placement(first), _unpack_placement(second)
+
+    def _snapshot(self, chunk, field_cls):
+        layout = self._layout
+        offset = self._start + chunk * layout.chunk_size
+        fields = []
+        for _ in xrange(2):
+            score, combo, solid = _FIELD_HEADER.unpack_from(self._data, offset)
+            offset += _FIELD_HEADER.size
+            field = field_cls(layout.h, layout.w, ScoreKeeper(score, combo))
+            if solid:
+                field.raise_base(solid)
+            for j in xrange(layout.h - solid):
+                data = self._data[offset + j * layout.row_bytes:
+                                  offset + (j + 1) * layout.row_bytes]
+                mask = sum(ord(c) << (8 * b) for b, c in enumerate(data))
+                for i in xrange(layout.w):
+                    if mask >> i & 1:
+                        field[j][i] = 2
+            offset += layout.h * layout.row_bytes
+            fields.append(field)
+        return fields
+
+    def fields(self, game_round, field_cls=Field):
+        """Both fields at the start of `game_round`"""
+        index = self._index(game_round)
+        chunk = index // self._layout.interval
+        fields = self._snapshot(chunk, field_cls)
+        start = chunk * self._layout.interval
+        blocks = itertools.chain(
+            (self.block(r) for r in xrange(self.first_round + start,
+                                           self.first_round + self.rounds)),
+            itertools.repeat(None)
+        )
+        game_state = GameState(blocks, self.first_round + start)
+        engine = Engine(fields, self.settings['player_names'], self.settings,
+                        game_state)
+        for k in xrange(start, index):
+            block_cls = game_state.current_block
+            for field, placement in zip(fields, self.placements(
+                    self.first_round + k)):
+                if placement is None:
+                    continue
+                rotation, x, y = placement
+                for i, j in block_cls.rotations[rotation].cells:
+                    field[y + j][x + i] = 2
+            engine.complete_round()
+        return tuple(fields)
@@ -9,3 +9,9 @@ class ScoreKeeper(object):
             self.combo += 1
         else:
             self.combo = 0
+
+    def snapshot(self):
+        return self.score, self.combo
+
+    def restore(self, snapshot):
+        self.score, self.combo = snapshot
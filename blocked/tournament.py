@@ -0,0 +1,258 @@
+"""Round-robin and Swiss tournaments between bots.
+
+A bot is given as 'module:factory', where calling the factory creates an
+object with an `action(field, opponent_field, game_state)` method returning
+the moves (see `blocked.moves`) for the block in play.  Games run in a pool
+of worker processes and each result is appended to a JSON lines file as soon
+as it arrives, so an interrupted tournament picks up where it stopped."""
+import argparse
+import hashlib
+import importlib
+import json
+import multiprocessing
+import os
+from collections import defaultdict, namedtuple, OrderedDict
+
+from .blocks import UniformBlockSource
+from .engine import Engine, GameState, _DEFAULT_SETTINGS
+from .exceptions import FirstPlayerWin, SecondPlayerWin
+from .field import Field
+
+GameSpec = namedtuple('GameSpec', 'game_id players seed')
+GameResult = namedtuple(
+    'GameResult', 'game_id players seed winner scores rounds'
+)
+Standing = namedtuple('Standing', 'bot games wins losses ties score rounds')
+
+
+def load_bot(spec):
+    module, _, factory = spec.partition(':')
+    return getattr(importlib.import_module(module), factory)()
+
+
+def game_seed(seed, game_id):
+    """Seed for one game, the same in any process for a tournament seed"""
+    digest = hashlib.md5('{}:{}'.format(seed, game_id)).hexdigest()
+    return int(digest[:8], 16)
+
+
+def winner_index(game_over):
+    """0 or 1 for the player who won the game, None for a tie"""
+    if isinstance(game_over, FirstPlayerWin):
+        return 0
+    if isinstance(game_over, SecondPlayerWin):
+        return 1
+    return None
+
+
+def play_game(spec, settings=None, max_rounds=1000):
+    """Play one game between the bots in `spec` and return its result.
+
+    A game still undecided after `max_rounds` goes to the higher score."""
+    settings = settings or _DEFAULT_SETTINGS
+    bots = [load_bot(p) for p in spec.players]
+    h, w = settings['field_height'], settings['field_width']
+    fields = Field(h, w), Field(h, w)
+    game_state = GameState(UniformBlockSource(spec.seed))
+    engine = Engine(fields, settings['player_names'], settings, game_state,
+                    max_rounds=max_rounds)
+
+    result = None
+    while result is None or not result.finished:
+        block_cls = game_state.current_block
+        x, y = game_state.block_position
+        # A bot is not asked to move a block which cannot be spawned
+        moves = [
+            bot.action(fields[p], fields[1 - p], game_state)
+            if fields[p].fits(block_cls.rotations[0].row_masks, x, y)
+            else None
+            for p, bot in enumerate(bots)
+        ]
+        result = engine.step(*moves)
+
+    return GameResult(spec.game_id, spec.players, spec.seed, result.winner,
+                      (fields[0].score, fields[1].score), game_state.round)
+
+
+def _play(args):
+    return play_game(*args)
+
+
+def round_robin(bots, games_per_pair, seed):
+    """Every pair of bots plays `games_per_pair` games from each seat"""
+    for a in xrange(len(bots)):
+        for b in xrange(a + 1, len(bots)):
+            for k in xrange(games_per_pair):
+                for first, second in ((a, b), (b, a)):
+                    game_id = 'rr:{}:{}:{}'.format(first, second, k)
+                    yield GameSpec(game_id, (bots[first], bots[second]),
+                                   game_seed(seed, game_id))
+
+
+def swiss_pairings(bots, results, swiss_round, seed):
+    """Pair bots with similar points for a Swiss round, avoiding rematches
+    where possible.  With an odd number of bots the lowest ranked one
+    without a bye sits out"""
+    points = dict((bot, 0.0) for bot in bots)
+    met = set()
+    seated = defaultdict(set)
+    for result in results:
+        first, second = result.players
+        met.add((first, second))
+        met.add((second, first))
+        seated[result.game_id.split(':')[1]].update(result.players)
+        if result.winner is None:
+            points[first] += 0.5
+            points[second] += 0.5
+        else:
+            points[result.players[result.winner]] += 1
+    byes = set(b for players in seated.itervalues()
+               for b in bots if b not in players)
+
+    ranked = sorted(bots, key=lambda b: (-points[b], bots.index(b)))
+    if len(ranked) % 2:
+        bye = next((b for b in reversed(ranked) if b not in byes), ranked[-1])
+        ranked.remove(bye)
+
+    pairs = []
+    while ranked:
+        first = ranked.pop(0)
+        opponent = next((b for b in ranked if (first, b) not in met),
+                        ranked[0])
+        ranked.remove(opponent)
+        pairs.append((first, opponent))
+
+    for table, (first, second) in enumerate(pairs):
+        if (swiss_round + table) % 2:
+            first, second = second, first
+        game_id = 'swiss:{}:{}'.format(swiss_round, table)
+        yield GameSpec(game_id, (first, second), game_seed(seed, game_id))
+
+
+def standings(bots, results):
+    table = OrderedDict(
+        (bot, dict(games=0, wins=0, losses=0, ties=0, score=0, rounds=0))
+        for bot in bots
+    )
+    for result in results:
+        for p, bot in enumerate(result.players):
+            row = table[bot]
+            row['games'] += 1
+            row['score'] += result.scores[p]
+            row['rounds'] += result.rounds
+            if result.winner is None:
+                row['ties'] += 1
+            elif result.winner == p:
+                row['wins'] += 1
+            else:
+                row['losses'] += 1
+    return sorted(
+        (Standing(bot, **row) for bot, row in table.iteritems()),
+        key=lambda s: (-(s.wins + 0.5 * s.ties), -s.score)
+    )
+
+
+class Tournament(object):
+    def __init__(self, bots, results_path, seed=0, processes=None,
+                 settings=None, max_rounds=1000):
+        self.bots = list(bots)
+        self.results_path = results_path
+        self.seed = seed
+        self._processes = processes
+        self._settings = settings or _DEFAULT_SETTINGS
+        self._max_rounds = max_rounds
+        self.results = self._load_results()
+
+    def _load_results(self):
+        results = OrderedDict()
+        if not os.path.exists(self.results_path):
+            return results
+        with open(self.results_path, 'r+') as f:
+            complete = 0
+            for line in f:
+                if not line.endswith('\n'):
+                    # Partly written result from an interrupted run
+                    break
+                record = json.loads(line)
+                record['players'] = tuple(record['players'])
+                record['scores'] = tuple(record['scores'])
+                results[record['game_id']] = GameResult(**record)
+                complete += len(line)
+            f.truncate(complete)
+        return results
+
+    def _run(self, specs, pool):
+        specs = [s for s in specs if s.game_id not in self.results]
+        args = [(s, self._settings, self._max_rounds) for s in specs]
+        with open(self.results_path, 'a') as f:
+            for result in pool.imap_unordered(_play, args):
+                f.write(json.dumps(result._asdict()) + '\n')
+                f.flush()
+                self.results[result.game_id] = result
+
+    def _pool(self):
+        return multiprocessing.Pool(self._processes)
+
+    def round_robin(self, games_per_pair=1):
+        pool = self._pool()
+        try:
+            self._run(round_robin(self.bots, games_per_pair, self.seed), pool)
+        except BaseException:
+            pool.terminate()
+            raise
+        pool.close()
+        pool.join()
+        return standings(self.bots, self.results.itervalues())
+
+    def swiss(self, rounds):
+        pool = self._pool()
+        try:
+            for swiss_round in xrange(rounds):
+                played = [r for r in self.results.itervalues()
+                          if r.game_id.startswith('swiss:') and
+                          int(r.game_id.split(':')[1]) < swiss_round]
+                self._run(swiss_pairings(self.bots, played, swiss_round,
+                                         self.seed), pool)
+        except BaseException:
+            pool.terminate()
+            raise
+        pool.close()
+        pool.join()
+        return standings(self.bots, self.results.itervalues())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Play a tournament between bots given as module:factory'
+    )
+    parser.add_argument('bots', nargs='+')
+    parser.add_argument('--format', choices=('round-robin', 'swiss'),
+                        default='round-robin')
+    parser.add_argument('--games', type=int, default=1,
+                        help='games per pair and seat for round-robin')
+    parser.add_argument('--rounds', type=int, default=3,
+                        help='number of Swiss rounds')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--max-rounds', type=int, default=1000)
+    parser.add_argument('--output', default='tournament.jsonl',
+                        help='results file, resumed if it already exists')
+    args = parser.parse_args(argv)
+
+    tournament = Tournament(args.bots, args.output, seed=args.seed,
+                            processes=args.processes,
+                            max_rounds=args.max_rounds)
+    if args.format == 'swiss':
+        table = tournament.swiss(args.rounds)
+    else:
+        table = tournament.round_robin(args.games)
+
+    print('{:<40} {:>5} {:>5} {:>5} {:>5} {:>8}'.format(
+        'bot', 'games', 'won', 'lost', 'tied', 'score'))
+    for s in table:
+        print('{:<40} {:>5} {:>5} {:>5} {:>5} {:>8}'.format(
+            s.bot, s.games, s.wins, s.losses, s.ties, s.score))
+
+
+if __name__ == '__main__':
+    main()
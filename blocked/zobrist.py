@@ -0,0 +1,201 @@
+"""Zobrist hashing of fields and bounded tables of search results.
+
+Every (column, cell value) has a random 64 bit key and a row's hash is the
+xor of the keys of its cells, kept up to date by the row on each write.  A
+field's hash (`Field.zobrist`) mixes the hash of each row with its index.
+Tables map such hashes, or any key built from them, to values found by a
+search and the depth they were searched to."""
+import abc
+import hashlib
+import sys
+from collections import namedtuple, OrderedDict
+
+MASK = (1 << 64) - 1
+
+
+def _key(*args):
+    """Random looking 64 bit key, the same in every process"""
+    return int(hashlib.md5(repr(args)).hexdigest()[:16], 16)
+
+
+# CELL_KEYS[value][column], value 0 (empty) has no effect on the hash.
+# Extended in place by `cell_keys` for wider rows
+CELL_KEYS = [[], [], [], []]
+_ROW_KEYS = []
+_filled_rows = {}
+
+
+def cell_keys(w):
+    """Keys by value and column, for rows at least `w` wide"""
+    while len(CELL_KEYS[0]) < w:
+        i = len(CELL_KEYS[0])
+        CELL_KEYS[0].append(0)
+        for value in (1, 2, 3):
+            CELL_KEYS[value].append(_key('cell', value, i))
+    return CELL_KEYS
+
+
+def row_hash(w, value):
+    """Hash of a row of `w` cells all holding `value`"""
+    try:
+        return _filled_rows[w, value]
+    except KeyError:
+        keys = cell_keys(w)[value]
+        h = 0
+        for i in xrange(w):
+            h ^= keys[i]
+        _filled_rows[w, value] = h
+        return h
+
+
+def cells_hash(row):
+    """Hash of a row from its cells"""
+    keys = cell_keys(row.w)
+    h = 0
+    for i in xrange(row.w):
+        h ^= keys[row[i]][i]
+    return h
+
+
+def _row_key(j):
+    while len(_ROW_KEYS) <= j:
+        _ROW_KEYS.append(_key('row', len(_ROW_KEYS)))
+    return _ROW_KEYS[j]
+
+
+def field_hash(rows):
+    """Hash of a field from its rows, top first"""
+    h = 0
+    for j, row in enumerate(rows):
+        # splitmix64 finaliser so equal rows at different heights differ
+        z = (row.hash ^ _row_key(j)) & MASK
+        z = ((z ^ (z >> 30)) * 0xbf58476d1ce4e5b9) & MASK
+        z = ((z ^ (z >> 27)) * 0x94d049bb133111eb) & MASK
+        h ^= z ^ (z >> 31)
+    return h
+
+
+TableStats = namedtuple(
+    'TableStats', 'entries capacity hits misses hit_rate evictions memory'
+)
+
+
+class TranspositionTable(object):
+    """Bounded map from position keys to (depth, value).
+
+    `get` finds a value stored for a key searched at least as deep as asked
+    for.  Subclasses decide which entries make way for new ones when the
+    table is full, implementing `put`, `_lookup`, `clear`, `__len__` and
+    `_memory` (bytes held by the entries)."""
+    __metaclass__ = abc.ABCMeta
+
+    def __init__(self, capacity=1 << 16):
+        self.capacity = capacity
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key, depth=0):
+        entry = self._lookup(key)
+        if entry is not None and entry[0] >= depth:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        return None
+
+    @abc.abstractmethod
+    def put(self, key, value, depth=0):
+        """Store the value of a key searched to `depth`"""
+
+    @abc.abstractmethod
+    def _lookup(self, key):
+        """The (depth, value) stored for a key, or None"""
+
+    @abc.abstractmethod
+    def clear(self):
+        pass
+
+    @abc.abstractmethod
+    def __len__(self):
+        pass
+
+    @abc.abstractmethod
+    def _memory(self):
+        pass
+
+    @property
+    def stats(self):
+        lookups = self.hits + self.misses
+        return TableStats(len(self), self.capacity, self.hits, self.misses,
+                          self.hits / float(lookups) if lookups else 0.0,
+                          self.evictions, self._memory())
+
+
+class LRUTable(TranspositionTable):
+    """Evicts the entry least recently stored or found"""
+
+    def __init__(self, capacity=1 << 16):
+        super(LRUTable, self).__init__(capacity)
+        self._entries = OrderedDict()
+
+    def _lookup(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._entries[key] = entry
+        return entry
+
+    def put(self, key, value, depth=0):
+        entries = self._entries
+        if entries.pop(key, None) is None and len(entries) >= self.capacity:
+            entries.popitem(last=False)
+            self.evictions += 1
+        entries[key] = depth, value
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _memory(self):
+        return sys.getsizeof(self._entries) + sum(
+            sys.getsizeof(k) + sys.getsizeof(e)
+            for k, e in self._entries.iteritems()
+        )
+
+
+class DepthPreferredTable(TranspositionTable):
+    """Fixed slots indexed by key, an entry is only replaced by one searched
+    at least as deep"""
+
+    def __init__(self, capacity=1 << 16):
+        super(DepthPreferredTable, self).__init__(capacity)
+        self._slots = [None] * capacity
+        self._size = 0
+
+    def _lookup(self, key):
+        slot = self._slots[hash(key) % self.capacity]
+        if slot is not None and slot[0] == key:
+            return slot[1:]
+        return None
+
+    def put(self, key, value, depth=0):
+        index = hash(key) % self.capacity
+        slot = self._slots[index]
+        if slot is None:
+            self._size += 1
+        elif slot[1] > depth:
+            return
+        elif slot[0] != key:
+            self.evictions += 1
+        self._slots[index] = key, depth, value
+
+    def clear(self):
+        self._slots = [None] * self.capacity
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def _memory(self):
+        return sys.getsizeof(self._slots) + sum(
+            sys.getsizeof(s) for s in self._slots if s is not None
+        )
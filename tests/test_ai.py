@@ -0,0 +1,86 @@
+import time
+from multiprocessing.pool import ThreadPool
+
+import pytest
+
+from blocked.ai import SearchBot
+from blocked.bitfield import BitField
+from blocked.blocks import IBlock, OBlock, SequenceBlockSource
+from blocked.engine import GameState
+from blocked.field import Field
+from blocked.moves import apply_moves
+from blocked.tournament import GameSpec, play_game
+
+
+def _game_state(*blocks):
+    game_state = GameState(SequenceBlockSource([b.type for b in blocks],
+                                               repeat=True))
+    game_state.block_position = 2, -1
+    return game_state
+
+
+def test_clears_rows():
+    """the bot completes rows when it can and leaves the field untouched"""
+    for field_cls in (Field, BitField):
+        board = '0,0,0,0,0,0;0,0,0,0,0,0;0,0,0,0,0,0;0,0,0,0,0,0;' \
+                '2,2,2,2,0,0;2,2,2,2,0,0'
+        field = field_cls.from_str(board)
+        bot = SearchBot(time_per_move=2000, max_depth=2)
+        moves = bot.action(field, Field(6, 6), _game_state(OBlock, IBlock))
+        assert str(field) == board
+        apply_moves(OBlock(field, (2, -1)), moves)
+        field.remove_completed_rows()
+        assert field.score == 2
+        assert bot.stats[0].depth == 2
+        assert bot.stats[0].nodes > 0
+
+
+def test_rank():
+    """placements are ranked best first, leaving the field untouched"""
+    board = '0,0,0,0,0,0;0,0,0,0,0,0;0,0,0,0,0,0;0,0,0,0,0,0;' \
+            '2,2,2,2,0,0;2,2,2,2,0,0'
+    field = Field.from_str(board)
+    ranked = SearchBot(max_depth=2).rank(field, (OBlock, IBlock), (2, -1))
+    assert str(field) == board
+    assert [value for value, _ in ranked] == \
+        sorted((value for value, _ in ranked), reverse=True)
+    assert ranked[0][1][:3] == (0, 4, 4)
+    with pytest.raises(ValueError):
+        SearchBot(max_depth=2).rank(field, (OBlock, IBlock), (2, -1), depth=0)
+
+
+def test_respects_time_per_move():
+    field = Field(20, 10)
+    bot = SearchBot(time_per_move=100, max_depth=10)
+    game_state = GameState()
+    start = time.time()
+    bot.action(field, Field(20, 10), game_state)
+    assert time.time() - start < 0.5
+    assert 1 <= bot.stats[0].depth < 10
+    assert bot.stats[0].nodes_per_second > 0
+
+
+def test_pool_matches_serial():
+    field = Field.from_str(';'.join(['0,0,0,0,0,0'] * 6 + ['2,0,2,2,0,2']))
+    game_state = _game_state(IBlock, OBlock)
+    serial = SearchBot(time_per_move=10000, max_depth=3)
+    pool = ThreadPool(2)
+    try:
+        pooled = SearchBot(time_per_move=10000, max_depth=3, pool=pool)
+        assert pooled.action(field, field, game_state) == \
+            serial.action(field, field, game_state)
+    finally:
+        pool.terminate()
+    assert pooled.stats[0].nodes == serial.stats[0].nodes
+
+
+def test_plays_tournament_game():
+    settings = dict(field_height=12, field_width=10,
+                    player_names=('player1', 'player2'))
+    result = play_game(GameSpec('g', ('tests.test_ai:fast_bot',) * 2, 3),
+                       settings, max_rounds=20)
+    assert result.rounds == 20
+
+
+def fast_bot():
+    return SearchBot(time_per_move=50, max_depth=2)
@@ -0,0 +1,169 @@
+import random
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from blocked.batch import BatchEngine, BLOCK_TYPES, RUNNING, \
+    FIRST_PLAYER_WIN, SECOND_PLAYER_WIN, TIE
+from blocked.blocks import BLOCKS
+from blocked.engine import Engine, GameState
+from blocked.exceptions import GameOver, FirstPlayerWin, SecondPlayerWin, \
+    Tie
+from blocked.field import Field
+from blocked.moves import placements, apply_moves
+from blocked.score import ScoreKeeper
+
+_OUTCOMES = {
+    FirstPlayerWin: FIRST_PLAYER_WIN,
+    SecondPlayerWin: SECOND_PLAYER_WIN,
+    Tie: TIE,
+}
+
+
+class _ReferenceGame(object):
+    """One game played through Engine, choosing random placements"""
+
+    def __init__(self, seed, h, w):
+        self.rng = random.Random(seed)
+        blocks = [BLOCKS[t] for t in BLOCK_TYPES]
+        source = iter(lambda: self.rng.choice(blocks), None)
+        self.state = GameState(source)
+        self.state.block_position = w // 2 - 1, -1
+        self.fields = Field(h, w), Field(h, w)
+        self.engine = Engine(self.fields, ('p1', 'p2'),
+                             game_state=self.state)
+        self.outcome = RUNNING
+
+    def play_block(self):
+        """Place a block for both players, returning their placements"""
+        block_cls = self.state.current_block
+        chosen, over = [], [False, False]
+        for p, field in enumerate(self.fields):
+            options = placements(field, block_cls, self.state.block_position)
+            if not options:
+                chosen.append(None)
+                over[p] = True
+                continue
+            # Favour low placements so that rows are cleared and sent
+            options.sort(key=lambda o: -o.y)
+            placement = self.rng.choice(options[:3])
+            chosen.append(placement)
+            try:
+                apply_moves(block_cls(field, self.state.block_position),
+                            placement.moves)
+            except GameOver:
+                over[p] = True
+        if any(over):
+            self.outcome = _OUTCOMES[
+                type(self.engine._determine_winner(*over))
+            ]
+        return BLOCK_TYPES.index(block_cls.type), chosen
+
+    def complete_round(self):
+        try:
+            self.engine.complete_round()
+        except GameOver as e:
+            self.outcome = _OUTCOMES[type(e)]
+
+
+@pytest.mark.parametrize('h, w', [(12, 6), (20, 10)])
+def test_matches_engine(h, w):
+    games = [_ReferenceGame(seed, h, w) for seed in range(16)]
+    batch = BatchEngine(len(games), h, w)
+
+    for _ in range(200):
+        running = [g for g in games if g.outcome == RUNNING]
+        if not running:
+            break
+        active = np.array([g.outcome == RUNNING for g in games])
+        types = np.zeros(len(games), dtype=int)
+        rotations = np.full((len(games), 2), -1, dtype=int)
+        xs = np.zeros((len(games), 2), dtype=int)
+        ys = np.zeros((len(games), 2), dtype=int)
+        for k, game in enumerate(games):
+            if game.outcome != RUNNING:
+                continue
+            types[k], chosen = game.play_block()
+            for p, placement in enumerate(chosen):
+                if placement is not None:
+                    rotations[k, p] = placement.rotation
+                    xs[k, p], ys[k, p] = placement.x, placement.y
+
+        batch.place(types, rotations, xs, ys, active)
+        for game in games:
+            if game.outcome == RUNNING:
+                game.complete_round()
+        batch.complete_round()
+
+        for k, game in enumerate(games):
+            assert batch.outcome[k] == game.outcome
+            if active[k] and game.outcome == RUNNING:
+                for p, field in enumerate(game.fields):
+                    assert batch.field_str(k, p) == str(field)
+                    assert batch.score[k, p] == field.score
+                    assert batch.combo[k, p] == field.combo
+    assert not batch.running.any()
+
+
+def test_from_fields_round_trip():
+    pairs = [
+        (Field.from_str('0,0,0;0,2,0;3,3,3', ScoreKeeper(5, 1)),
+         Field.from_str('0,0,0;2,2,0;2,0,2', ScoreKeeper(0, 0))),
+    ]
+    batch = BatchEngine.from_fields(pairs)
+    assert batch.field_str(0, 0) == '0,0,0;0,2,0;3,3,3'
+    assert batch.field_str(0, 1) == '0,0,0;2,2,0;2,0,2'
+    field = batch.field(0, 0)
+    assert (field.score, field.combo) == (5, 1)
+
+
+def test_simultaneous_game_over_tie():
+    s = '2,0,0;2,0,0;2,2,0;2,2,2'
+    pairs = [(Field.from_str(s, ScoreKeeper(3, 4)),
+              Field.from_str(s, ScoreKeeper(3, 4)))]
+    batch = BatchEngine.from_fields(pairs)
+    batch.complete_round()
+    assert batch.outcome[0] == TIE
+    with pytest.raises(Tie):
+        Engine(pairs[0], ('p1', 'p2'), game_state=GameState(
+            iter(BLOCKS.values()))).complete_round()
+
+
+def test_garbage_ends_game():
+    pairs = [(Field.from_str('0,0,0;2,0,0;2,2,2;2,2,2', ScoreKeeper(3, 3)),
+              Field.from_str('0,0,0;0,2,0;2,2,0;2,0,2', ScoreKeeper(0, 0)))]
+    batch = BatchEngine.from_fields(pairs)
+    batch.complete_round()
+    assert batch.outcome[0] == FIRST_PLAYER_WIN
+    assert batch.field_str(0, 1) == '0,2,0;2,2,0;2,0,2;3,3,3'
+    with pytest.raises(FirstPlayerWin):
+        Engine(pairs[0], ('p1', 'p2'), game_state=GameState(
+            iter(BLOCKS.values()))).complete_round()
+    assert str(pairs[0][1]) == batch.field_str(0, 1)
+
+
+def test_off_edge_placements_refused():
+    """blocks reaching past either side of the field are refused, as by
+    `Field.fits`"""
+    i_block = BLOCK_TYPES.index('I')
+    for x in (-2, 2):
+        field = Field(6, 4)
+        assert not field.fits(BLOCKS['I'].rotations[0].row_masks, x, 2)
+        batch = BatchEngine.from_fields([(field, Field(6, 4))])
+        with pytest.raises(ValueError):
+            batch.place([i_block], [[0, 0]], [[x, 0]], [[2, 2]])
+        assert batch.field_str(0, 0) == str(field)
+
+
+def test_refused_placement_leaves_state():
+    """a placement refused on any row changes no field"""
+    pairs = [(Field.from_str('0,0,0,0;0,0,0,0;0,0,0,0;0,2,0,0'),
+              Field.from_str('0,0,0,0;0,0,0,0;0,0,0,0;0,0,0,0'))]
+    batch = BatchEngine.from_fields(pairs)
+    o_block = BLOCK_TYPES.index('O')
+    with pytest.raises(ValueError):
+        batch.place([o_block], [[0, 0]], [[1, 0]], [[2, 2]])
+    assert batch.field_str(0, 0) == str(pairs[0][0])
+    assert batch.field_str(0, 1) == str(pairs[0][1])
+    assert batch.outcome[0] == RUNNING
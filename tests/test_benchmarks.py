@@ -0,0 +1,49 @@
+from benchmarks.run import measure, run_benchmarks, regressions
+from benchmarks.workloads import BACKENDS, WORKLOADS, garbage_str
+
+from blocked.field import Field
+
+
+def test_workloads_run_on_every_backend():
+    names = [n for n in WORKLOADS if not n.startswith('random_game')]
+    results = run_benchmarks(duration=0, repeat=1, names=names)
+    assert sorted(results) == sorted(
+        '{}[{}]'.format(n, b) for n in names for b in BACKENDS
+    )
+    assert all(r['ops_per_sec'] > 0 for r in results.itervalues())
+
+
+def test_random_game_reports_size():
+    results = run_benchmarks(duration=0, repeat=1, names=['random_game'],
+                             backends=['bit'])
+    assert results['random_game[bit]']['size'] > 0
+
+
+def test_setup_before_every_call():
+    calls = []
+    measure(lambda: calls.append('run'), 1, 0, repeat=2,
+            setup=lambda: calls.append('setup'))
+    assert calls == ['setup', 'run'] * 2
+
+
+def test_garbage_has_no_complete_rows():
+    field = Field.from_str(garbage_str(20, 10, 0, density=1))
+    field.remove_completed_rows()
+    assert field.score == 0
+
+
+def test_regressions():
+    baseline = {'a[list]': {'ops_per_sec': 100.0},
+                'b[list]': {'ops_per_sec': 100.0}}
+    results = {'a[list]': {'ops_per_sec': 85.0},
+               'b[list]': {'ops_per_sec': 70.0},
+               'c[list]': {'ops_per_sec': 1.0}}
+    assert regressions(results, baseline, 0.2) == [('b[list]', 100.0, 70.0)]
+
+
+def test_from_str_reads_rows_whole_ten_times_faster():
+    results = run_benchmarks(duration=0.1, repeat=3,
+                             names=['from_str', 'from_str_cells'])
+    for backend in BACKENDS:
+        assert results['from_str[{}]'.format(backend)]['ops_per_sec'] > \
+            10 * results['from_str_cells[{}]'.format(backend)]['ops_per_sec']
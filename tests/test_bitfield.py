@@ -0,0 +1,71 @@
+import random
+
+import pytest
+
+from blocked.bitfield import BitField
+from blocked.blocks import OBlock, IBlock
+from blocked.exceptions import GameOver
+from blocked.field import Field
+from blocked.score import ScoreKeeper
+
+
+def test_str_round_trip():
+    for s in ('0,0;0,0', '0,0,2;0,0,2', '0,0,2;3,3,3',
+              '0,1,1,0;0,0,2,2;0,2,2,2;3,3,3,3'):
+        assert str(BitField.from_str(s)) == s
+        assert str(BitField.from_str(bytearray(s))) == s
+        assert BitField.from_str(s) == BitField._from_cells(s)
+        assert BitField.from_str(s).zobrist == Field.from_str(s).zobrist
+
+
+def test_cells():
+    field = BitField(2, 3)
+    field[1][0] = 2
+    field[1][2] = 1
+    assert [field[1][i] for i in range(3)] == [2, 0, 1]
+    field[1][2] = 0
+    assert str(field) == '0,0,0;2,0,0'
+    assert field[1][3] > 1
+    assert field[1][-1] > 1
+    assert field[2][0] > 1
+
+
+def test_row_completion_matches_field():
+    s = '0,0,0,0,0;2,2,2,2,2;2,0,2,2,2;2,2,2,2,2;0,0,0,2,0;3,3,3,3,3'
+    fields = [cls.from_str(s, ScoreKeeper(3, 1)) for cls in (Field, BitField)]
+    for field in fields:
+        field.remove_completed_rows()
+    assert str(fields[0]) == str(fields[1])
+    assert fields[0].score == fields[1].score == 6
+    assert fields[0].combo == fields[1].combo == 2
+
+
+def test_raising():
+    field = BitField.from_str('0,0,0,0;0,0,2,2;2,2,2,0')
+    field.raise_base()
+    assert str(field) == '0,0,2,2;2,2,2,0;3,3,3,3'
+    field.remove_completed_rows()
+    assert str(field) == '0,0,2,2;2,2,2,0;3,3,3,3'
+    with pytest.raises(GameOver):
+        field.raise_base()
+
+
+def test_blocks_on_bit_field():
+    field = BitField(6, 4)
+    OBlock(field, (0, 0)).drop()
+    IBlock(field, (0, -1)).drop()
+    assert str(field) == '0,0,0,0;0,0,0,0;0,0,0,0;2,2,2,2;2,2,0,0;2,2,0,0'
+
+
+def test_fits_matches_field():
+    rng = random.Random(3)
+    for _ in range(50):
+        s = ';'.join(
+            ','.join(str(rng.choice((0, 0, 2))) for _ in range(6))
+            for _ in range(5)
+        )
+        field, bit_field = Field.from_str(s), BitField.from_str(s)
+        masks = tuple(rng.randint(0, 7) for _ in range(3))
+        for x in range(-3, 8):
+            for y in range(-4, 6):
+                assert field.fits(masks, x, y) == bit_field.fits(masks, x, y)
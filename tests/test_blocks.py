@@ -1,6 +1,11 @@
+import pickle
+
 import pytest
 
-from blocked.blocks import rotate_cw, rotate_ccw, OBlock, IBlock
+from blocked.blocks import rotate_cw, rotate_ccw, OBlock, IBlock, BLOCKS, \
+    BLOCK_TYPES, BlockSource, UniformBlockSource, BagBlockSource, \
+    SequenceBlockSource
+from blocked.engine import GameState
 from blocked.exceptions import InvalidBlockPosition, CannotMoveBlock,\
     GameOver, InvalidBlockRotation
 from blocked.field import Field
@@ -17,6 +22,23 @@ def test_matrix_rotation():
     assert tr(tr(tr(tr(s)))) == s == tl(tl(tl(tl(s))))
 
 
+def test_rotation_tables():
+    """each block class carries its four precomputed rotation states"""
+    for block_cls in BLOCKS.values():
+        shape = block_cls.shape
+        for rotation in block_cls.rotations:
+            assert rotation.shape == shape
+            assert sorted(rotation.cells) == sorted(
+                (i, j) for j, row in enumerate(shape)
+                for i, v in enumerate(row) if v
+            )
+            assert rotation.row_masks == tuple(
+                int(''.join(map(str, reversed(row))), 2) for row in shape
+            )
+            shape = rotate_cw(shape)
+        assert shape == block_cls.shape
+
+
 def test_o_block():
     field = Field(6, 4)
     block = OBlock(field)
@@ -59,6 +81,7 @@ def test_i_block():
 
     block.rotate_cw().rotate_cw()
     assert str(field) == '0,0,1,0;0,0,1,0;0,0,1,0;0,0,0,0;0,0,0,0;0,0,0,0'
+    assert block.rotation == 1
     block.position = 1, 2
     assert str(field) == '0,0,0,0;0,0,0,0;0,0,0,1;0,0,0,1;0,0,0,1;0,0,0,1'
 
@@ -114,3 +137,94 @@ def test_ending_game_with_drop():
 
     with pytest.raises(GameOver):
         oblock.drop()
+
+
+def test_non_raising_moves():
+    """try_move/try_rotate report failure instead of raising"""
+    field = Field.from_str('0,0,0,0;0,0,0,0;0,0,0,2;0,0,0,2;0,0,0,2;0,0,0,2')
+    block = IBlock(field, (0, -1))
+    assert not block.try_move(1, -1)
+    assert block.try_move(0, 0)
+    assert block.position == (0, 0)
+    assert block.try_rotate(-1)
+    assert block.rotation == 3
+    assert str(field) == '0,1,0,0;0,1,0,0;0,1,0,2;0,1,0,2;0,0,0,2;0,0,0,2'
+    assert block.try_move(1, 2)
+    assert not block.try_rotate(1)
+    assert block.rotation == 3
+
+    assert block.hard_drop() == (1, 2)
+    assert str(field) == '0,0,0,0;0,0,0,0;0,0,2,2;0,0,2,2;0,0,2,2;0,0,2,2'
+    assert block.hard_drop() is None
+    assert not block.try_move(0, 2)
+    assert not block.try_rotate()
+
+
+def test_hard_drop_over_overhang():
+    """the drop stops at the first block under any column of the piece"""
+    field = Field.from_str('0,0,0,0;0,0,0,0;0,0,2,0;0,0,0,0;2,0,0,0')
+    block = OBlock(field, (1, -2))
+    assert block.hard_drop() == (1, 0)
+    assert str(field) == '0,2,2,0;0,2,2,0;0,0,2,0;0,0,0,0;2,0,0,0'
+
+
+def test_seeded_sources_repeat():
+    for source_cls in (UniformBlockSource, BagBlockSource):
+        a, b = source_cls(5), source_cls(5)
+        first = [next(a) for _ in range(300)]
+        assert first == [BLOCKS[BLOCK_TYPES[i]] for i in b.take(300)]
+        assert first != [next(source_cls(6)) for _ in range(300)]
+
+
+def test_source_fork_and_pickle():
+    source = BagBlockSource(1)
+    source.take(10)
+    fork = source.fork()
+    copied = pickle.loads(pickle.dumps(source))
+    expected = list(source.take(50))
+    assert list(fork.take(50)) == expected
+    assert list(copied.take(50)) == expected
+
+
+def test_bag_source():
+    """every run of seven blocks from the start holds each type once"""
+    blocks = BagBlockSource(2).take(700)
+    for k in range(0, 700, 7):
+        assert sorted(blocks[k:k + 7]) == range(7)
+
+
+def test_sequence_source(tmpdir):
+    path = tmpdir.join('blocks.txt')
+    path.write('O, I, T\nZ\n')
+    assert [b.type for b in SequenceBlockSource.from_file(str(path))] == \
+        ['O', 'I', 'T', 'Z']
+    repeating = SequenceBlockSource('OIT', repeat=True)
+    assert [next(repeating).type for _ in range(7)] == list('OITOITO')
+    assert [BLOCK_TYPES[i] for i in repeating.take(4)] == list('ITOI')
+    assert len(SequenceBlockSource('SZ').take(5)) == 2
+
+
+def test_source_needs_generate():
+    """sources must say how they generate blocks"""
+    class Incomplete(BlockSource):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_game_states_have_own_sources():
+    assert GameState()._block_source is not GameState()._block_source
+
+
+def test_tentative_placement():
+    """a block placed without moving it can be undone, placements which do
+    not fit give None"""
+    field = Field.from_str('0,0,0,0;0,0,0,0;2,2,0,0')
+    snapshot = IBlock.place(field, 1, 0, -1)
+    assert snapshot is None
+    snapshot = OBlock.place(field, 0, 2, 1)
+    assert str(field) == '0,0,0,0;0,0,2,2;2,2,2,2'
+    assert OBlock.place(field, 0, 1, 1) is None
+    field.restore(snapshot)
+    assert str(field) == '0,0,0,0;0,0,0,0;2,2,0,0'
@@ -0,0 +1,104 @@
+import pytest
+
+from blocked.ai.book import PlacementBook, BookBot, surface_profile, \
+    profile_field, collect_profiles, generate, spawn_position
+from blocked.ai.search import SearchBot
+from blocked.blocks import OBlock, IBlock, SequenceBlockSource, \
+    UniformBlockSource
+from blocked.engine import Engine, GameState
+from blocked.field import Field
+from blocked.moves import execute
+
+
+def _game_state(*blocks):
+    game_state = GameState(SequenceBlockSource([b.type for b in blocks],
+                                               repeat=True))
+    game_state.block_position = spawn_position(6)
+    return game_state
+
+
+class _Fallback(object):
+    def __init__(self):
+        self.calls = 0
+
+    def action(self, field, opponent_field, game_state):
+        self.calls += 1
+        return ['drop']
+
+
+def test_surface_profile():
+    field = Field.from_str('0,0,0,0,0,0;0,0,0,0,2,0;0,2,0,0,2,0;'
+                           '0,2,2,0,2,2;2,2,2,0,2,2;3,3,3,3,3,3')
+    assert surface_profile(field, clamp=4) == (1, 3, 2, 0, 4, 2)
+    assert surface_profile(field) == (1, 2, 2, 0, 2, 2)
+    assert surface_profile(profile_field((1, 3, 2, 0, 4, 2), 8), clamp=4) == \
+        (1, 3, 2, 0, 4, 2)
+
+
+def test_book_lookup(tmpdir):
+    profiles = collect_profiles(1, width=6, height=8, clamp=2,
+                                max_rounds=10)
+    path = str(tmpdir.join('book'))
+    entries = generate(path, profiles[:3], clamp=2, height=8, depth=2,
+                       processes=2)
+    assert entries == 3 * 7 * 7
+
+    fallback = _Fallback()
+    bot = BookBot(path, fallback)
+    game_state = _game_state(OBlock, IBlock)
+    field = profile_field(profiles[0], 8)
+    moves = bot.action(field, Field(8, 6), game_state)
+    assert fallback.calls == 0
+    assert moves[-1] == 'drop'
+    assert execute(field, OBlock, game_state.block_position,
+                   moves).first_failed is None
+
+    # A field whose surface is not in the book is searched
+    missing = next(p for p in [(2, 2, 2, 2, 2, 0), (0, 2, 0, 2, 0, 2)]
+                   if p not in profiles[:3])
+    bot.action(profile_field(missing, 8), Field(8, 6), game_state)
+    assert fallback.calls == 1
+    assert bot.book.stats == (entries, 2, 1, 0.5)
+    bot.book.close()
+
+
+def test_self_play_hit_rate(tmpdir):
+    """a book of the most common profiles of a few games is hit often in
+    games it was not made from"""
+    path = str(tmpdir.join('book'))
+    generate(path, collect_profiles(4, width=6, height=10,
+                                    max_rounds=60)[:30],
+             height=10, depth=1, processes=2)
+    bot = BookBot(path, SearchBot(max_depth=1))
+    for seed in (100, 101):
+        fields = Field(10, 6), Field(10, 6)
+        game_state = GameState(UniformBlockSource(seed))
+        game_state.block_position = spawn_position(6)
+        engine = Engine(fields, ('p1', 'p2'), game_state=game_state,
+                        max_rounds=60)
+        opponent = SearchBot(max_depth=1)
+        result = None
+        while result is None or not result.finished:
+            result = engine.step(
+                bot.action(fields[0], fields[1], game_state),
+                opponent.action(fields[1], fields[0], game_state)
+            )
+    assert bot.book.stats.lookups > 20
+    assert bot.book.stats.hit_rate > 0.3
+    bot.book.close()
+
+
+def test_generate_without_profiles(tmpdir):
+    with pytest.raises(ValueError):
+        generate(str(tmpdir.join('book')), [], processes=1)
+    assert not tmpdir.join('book').check()
+
+
+def test_generate_refuses_keys_too_large(tmpdir):
+    """sizes whose keys or columns do not fit a book are refused before
+    searching"""
+    path = str(tmpdir.join('book'))
+    for profile, clamp in (((0,) * 38, 2), ((0,) * 128, 0)):
+        with pytest.raises(ValueError):
+            generate(path, [profile], clamp=clamp, processes=1)
+    assert not tmpdir.join('book').check()
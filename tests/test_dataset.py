@@ -0,0 +1,97 @@
+import random
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from blocked.blocks import BLOCK_TYPES, UniformBlockSource
+from blocked.dataset import DatasetWriter, Dataset, pack_board, \
+    unpack_boards, WIN, LOSS, TIE, UNFINISHED
+from blocked.engine import Engine, GameState
+from blocked.field import Field
+from blocked.moves import placements
+
+
+def _play(writer, seed, h=10, w=6):
+    """A game of random placements, recorded.  Returns each board as a
+    grid of filled cells with the sample written for it"""
+    rng = random.Random(seed)
+    fields = Field(h, w), Field(h, w)
+    game_state = GameState(UniformBlockSource(seed))
+    game_state.block_position = w // 2 - 1, -1
+    recorder = writer.recorder(Engine(fields, ('p1', 'p2'),
+                                      game_state=game_state))
+    seen = []
+    result = None
+    while result is None or not result.finished:
+        block_cls = game_state.current_block
+        boards = [[[f[j][i] > 1 for i in xrange(w)] for j in xrange(h)]
+                  for f in fields]
+        moves = []
+        for field in fields:
+            options = placements(field, block_cls, game_state.block_position)
+            moves.append(rng.choice(options).moves if options else None)
+        result = recorder.step(*moves)
+        for p, placement in enumerate(result.placements):
+            if placement is not None:
+                seen.append((boards[p], block_cls.type, placement, p,
+                             result.round))
+    return seen, result.winner
+
+
+def test_samples_round_trip(tmpdir):
+    directory = str(tmpdir.join('data'))
+    with DatasetWriter(directory, 10, 6, shard_size=16) as writer:
+        games = [_play(writer, seed) for seed in xrange(3)]
+
+    dataset = Dataset(directory)
+    expected = [s for seen, _ in games for s in seen]
+    assert len(dataset) == len(expected) > 16
+    samples = dataset.take(range(len(dataset)))
+    boards = dataset.boards(samples)
+    winners = [winner for seen, winner in games for _ in seen]
+    for k, (board, block_type, placement, player, game_round) in \
+            enumerate(expected):
+        sample = dataset[k]
+        assert boards[k].tolist() == board
+        assert BLOCK_TYPES[sample['current']] == block_type
+        assert (sample['rotation'], sample['x'], sample['y']) == placement
+        assert (sample['player'], sample['round']) == (player, game_round)
+        assert sample['outcome'] == (TIE if winners[k] is None else
+                                     WIN if winners[k] == player else LOSS)
+    with pytest.raises(IndexError):
+        dataset[len(dataset)]
+
+
+def test_appending(tmpdir):
+    directory = str(tmpdir.join('data'))
+    with DatasetWriter(directory, 10, 6, shard_size=16) as writer:
+        first, _ = _play(writer, 0)
+    with DatasetWriter(directory, 10, 6) as writer:
+        assert len(writer) == len(first)
+        second, _ = _play(writer, 1)
+    dataset = Dataset(directory)
+    assert len(dataset) == len(first) + len(second)
+    assert UNFINISHED not in dataset.take(range(len(dataset)))['outcome']
+    board = dataset.boards(dataset.take([len(first)]))[0]
+    assert board.tolist() == second[0][0]
+
+
+def test_pack_board():
+    field = Field.from_str('0,0,0,0,0,0,0,0,0;0,2,0,0,0,0,0,0,2;'
+                           '3,3,3,3,3,3,3,3,3')
+    board = pack_board(field)
+    assert board.tolist() == [[0, 0], [2, 1], [255, 1]]
+    assert unpack_boards(board, 9).tolist() == [
+        [str(field[j][i]) in '23' for i in xrange(9)] for j in xrange(3)
+    ]
+
+
+def test_high_fields(tmpdir):
+    """placements low in fields over 127 rows high are kept as they were"""
+    directory = str(tmpdir.join('data'))
+    field = Field(200, 6)
+    with DatasetWriter(directory, 200, 6) as writer:
+        writer.append(pack_board(field), 0, 1, (1, 4, 196), 0, 0, 0, 1)
+    sample = Dataset(directory)[0]
+    assert (sample['rotation'], sample['x'], sample['y']) == (1, 4, 196)
@@ -1,9 +1,13 @@
+import random
 from cStringIO import StringIO
 from collections import OrderedDict
 
+import pytest
+
 from blocked.engine import SettingsReporter, GameReporter, Engine, \
-    PlayerReporter, GameState
+    PlayerReporter, GameState, StepResult, apply_field_delta
 from blocked.blocks import OBlock, IBlock, TBlock
+from blocked.exceptions import GameOver, Tie
 from blocked.field import Field
 from blocked.score import ScoreKeeper
 
@@ -139,3 +143,174 @@ def test_engine_round_complete():
         'update p2 field\n'
         '0,0,0,0;0,0,0,0;0,0,0,0;2,0,0,2;2,0,2,2;2,2,2,0;3,3,3,3\n'
     )
+
+
+def test_player_reporter_delta():
+    """only changed rows are reported between keyframes"""
+    f = Field.from_str('0,0,0,0;0,0,0,0;0,2,2,2;3,3,3,3')
+    reporter = PlayerReporter('p1', f, keyframe_interval=3)
+
+    assert _read_report(reporter).endswith(
+        'update p1 field\n0,0,0,0;0,0,0,0;0,2,2,2;3,3,3,3\n'
+    )
+    assert _read_report(reporter).endswith('update p1 field_delta\n\n')
+
+    f[1][0] = 2
+    f[2][0] = 2
+    assert _read_report(reporter) == (
+        'update p1 row_points 0\n'
+        'update p1 combo 0\n'
+        'update p1 field_delta\n'
+        '1:2,0,0,0;2:2,2,2,2\n'
+    )
+    f.remove_completed_rows()
+    assert _read_report(reporter).endswith(
+        'update p1 field\n0,0,0,0;0,0,0,0;2,0,0,0;3,3,3,3\n'
+    )
+
+
+def test_engine_delta_reports_match_full():
+    fields = [Field(6, 4), Field(6, 4)]
+    copies = [Field(6, 4), Field(6, 4)]
+    engine = Engine(fields, ('p1', 'p2'), settings=_test_settings,
+                    game_state=GameState(iter([OBlock] * 20)),
+                    keyframe_interval=4)
+    full = Engine(copies, ('p1', 'p2'), settings=_test_settings,
+                  game_state=GameState(iter([OBlock] * 20)))
+
+    seen = {}
+    for x in (0, 2, 0, 2, 1):
+        for field in fields + copies:
+            OBlock(field, (x, 0)).drop()
+        engine.complete_round()
+        full.complete_round()
+        lines = _read_report(engine).split('\n')
+        expected = _read_report(full).split('\n')
+        for name in ('p1', 'p2'):
+            combo = 'update {} combo'.format(name)
+            i = next(i for i, l in enumerate(lines) if l.startswith(combo)) + 1
+            j = expected.index('update {} field'.format(name)) + 1
+            if lines[i] == 'update {} field'.format(name):
+                seen[name] = lines[i + 1]
+            else:
+                seen[name] = apply_field_delta(seen[name], lines[i + 1])
+            assert seen[name] == expected[j]
+
+
+def test_report_written_at_once():
+    """the whole report goes to the output in a single write of bytes"""
+    class Output(object):
+        def __init__(self):
+            self.writes = []
+
+        def write(self, data):
+            self.writes.append(data)
+
+    engine = Engine((Field(4, 4), Field(4, 4)), ('p1', 'p2'),
+                    settings=_test_settings,
+                    game_state=GameState(iter([OBlock, IBlock, TBlock])))
+    output = Output()
+    engine.report_to(output)
+    assert len(output.writes) == 1
+    assert isinstance(output.writes[0], bytes)
+    assert output.writes[0] == _read_report(engine)
+
+
+def test_step():
+    """a whole round is played from the moves of both players"""
+    almost = ';'.join(['0,0,0,0,0,0,0,0,0,0'] * 6 +
+                      ['2,2,2,2,0,0,2,2,2,2'] * 2)
+    fields = Field.from_str(almost), Field(8, 10)
+    game_state = GameState(iter([OBlock] * 4))
+    engine = Engine(fields, ('p1', 'p2'), game_state=game_state)
+
+    result = engine.step(['drop'], ['left', 'left', 'drop'])
+    assert result == StepResult(1, False, None, ((0, 4, 6), (0, 2, 6)),
+                                (2, 0), (0, 0))
+    assert game_state.round == 2
+    assert str(fields[0]) == ';'.join(['0,0,0,0,0,0,0,0,0,0'] * 8)
+    assert str(fields[1]).endswith(
+        '0,0,2,2,0,0,0,0,0,0;0,0,2,2,0,0,0,0,0,0'
+    )
+
+    # No moves from player 2 ends the game in player 1's favour
+    result = engine.step(['drop'], None)
+    assert result == StepResult(2, True, 0, ((0, 4, 6), None), (0, 0), (0, 0))
+    assert game_state.round == 2
+
+
+def test_step_max_rounds():
+    fields = Field(8, 10), Field(8, 10)
+    engine = Engine(fields, ('p1', 'p2'),
+                    game_state=GameState(iter([OBlock] * 4)), max_rounds=1)
+    assert engine.step([], []) == \
+        StepResult(1, True, None, ((0, 4, 6), (0, 4, 6)), (0, 0), (0, 0))
+
+
+def _exchange_row_by_row(fields, to_add1, to_add2):
+    """Garbage exchange a row to each side at a time, stopping once a field
+    overflows"""
+    game_over1 = game_over2 = False
+    while to_add1 > 0 or to_add2 > 0:
+        if to_add1:
+            try:
+                fields[1].raise_base()
+            except GameOver:
+                game_over2 = True
+            to_add1 -= 1
+        if to_add2:
+            try:
+                fields[0].raise_base()
+            except GameOver:
+                game_over1 = True
+            to_add2 -= 1
+        if game_over1 or game_over2:
+            break
+    return game_over1, game_over2
+
+
+def test_garbage_exchange_matches_row_by_row():
+    rng = random.Random(2)
+    for _ in xrange(300):
+        rows = []
+        for _ in xrange(2):
+            stacked = rng.randint(0, 8)
+            cleared = rng.randint(0, min(4, 8 - stacked))
+            rows.append(['0,0,0,0'] * (8 - stacked - cleared) +
+                        ['2,2,2,2'] * cleared + ['2,0,2,2'] * stacked)
+        scores = [(rng.randint(0, 20), rng.randint(0, 12)) for _ in rows]
+        fields = [Field.from_str(';'.join(r), ScoreKeeper(*sc))
+                  for r, sc in zip(rows, scores)]
+        expected = [Field.from_str(';'.join(r), ScoreKeeper(*sc))
+                    for r, sc in zip(rows, scores)]
+
+        engine = Engine(fields, ('p1', 'p2'),
+                        game_state=GameState(iter([OBlock] * 4)))
+        try:
+            engine.complete_round()
+            outcome = None
+        except GameOver as e:
+            outcome = type(e)
+
+        before = [f.score for f in expected]
+        for f in expected:
+            f.remove_completed_rows()
+        over = _exchange_row_by_row(
+            expected, expected[0].score / 4 - before[0] / 4,
+            expected[1].score / 4 - before[1] / 4
+        )
+        reference = Engine(expected, ('p1', 'p2'),
+                           game_state=GameState(iter([OBlock] * 4)))
+        assert outcome == (type(reference._determine_winner(*over))
+                           if any(over) else None)
+        assert [str(f) for f in fields] == [str(f) for f in expected]
+
+
+def test_garbage_overflowing_both_fields_ties():
+    fields = [Field.from_str('0,0,0,0;2,2,2,2;2,0,2,2;2,0,2,2',
+                             ScoreKeeper(3, 8)) for _ in xrange(2)]
+    engine = Engine(fields, ('p1', 'p2'),
+                    game_state=GameState(iter([OBlock] * 4)))
+    with pytest.raises(Tie):
+        engine.complete_round()
+    assert [str(f) for f in fields] == ['2,0,2,2;2,0,2,2;3,3,3,3;3,3,3,3'] * 2
@@ -0,0 +1,91 @@
+import random
+
+from blocked.bitfield import BitField
+from blocked.blocks import IBlock, UniformBlockSource
+from blocked.engine import Engine, GameState
+from blocked.exceptions import GameOver
+from blocked.features import BoardFeatures, Features
+from blocked.field import Field
+from blocked.moves import placements, apply_moves
+
+
+def test_features_of_board():
+    field = Field.from_str('0,0,0,0,0;0,2,0,0,0;0,2,0,0,2;2,0,0,2,2;3,3,3,3,3')
+    features = BoardFeatures(field)
+    assert features.heights == [2, 4, 1, 2, 3]
+    assert features.features == Features(
+        aggregate_height=12, max_height=4, holes=1, bumpiness=7,
+        well_depth=2 + 1, rows_cleared=0
+    )
+
+
+def test_evaluate_with_clear():
+    field = Field.from_str('0,0,0,0;0,0,0,0;2,2,0,0;2,2,0,2')
+    features = BoardFeatures(field)
+    vertical, above = features.evaluate(IBlock, [(1, 0, 0), (0, 0, -2)])
+    assert vertical == Features(5, 3, 0, 5, 3, 1)
+    assert above is None
+    assert str(field) == '0,0,0,0;0,0,0,0;2,2,0,0;2,2,0,2'
+
+
+def _fresh(field):
+    return BoardFeatures(Field.from_str(str(field))).features
+
+
+def test_incremental_matches_scan():
+    """features tracked through play always equal a full recount"""
+    for field_cls in (Field, BitField):
+        rng = random.Random(4)
+        fields = field_cls(12, 6), field_cls(12, 6)
+        tracked = [BoardFeatures(f) for f in fields]
+        game_state = GameState(UniformBlockSource(9))
+        game_state.block_position = 2, -1
+        engine = Engine(fields, ('p1', 'p2'), game_state=game_state)
+        try:
+            for _ in range(200):
+                block_cls = game_state.current_block
+                for field, features in zip(fields, tracked):
+                    options = placements(field, block_cls,
+                                         game_state.block_position)
+                    if not options:
+                        raise GameOver()
+                    evaluated = features.evaluate(block_cls, options)
+                    for option, result in zip(options, evaluated):
+                        copy = Field.from_str(str(field))
+                        apply_moves(block_cls(copy, game_state.block_position),
+                                    option.moves)
+                        cleared = sum(copy[j].is_complete()
+                                      for j in range(copy.h))
+                        copy.remove_completed_rows()
+                        assert result == BoardFeatures(copy).features._replace(
+                            rows_cleared=cleared)
+                    options.sort(key=lambda o: -o.y)
+                    apply_moves(block_cls(field, game_state.block_position),
+                                rng.choice(options[:2]).moves)
+                    assert features.features == _fresh(field)
+                engine.complete_round()
+                for field, features in zip(fields, tracked):
+                    assert features.features == _fresh(field)
+        except GameOver:
+            pass
+        assert game_state.round > 10
+
+
+def test_restore_puts_back_features():
+    """restoring a snapshot puts back the features it was taken with, and
+    recounts them for snapshots taken before following the field"""
+    for field_cls in (Field, BitField):
+        field = field_cls.from_str('0,0,0,0;0,0,0,0;0,0,0,0;2,2,0,2')
+        before = field.snapshot()
+        features = BoardFeatures(field)
+        expected = features.features
+        snapshot = IBlock.place(field, 1, 0, 0)
+        field.remove_completed_rows()
+        assert features.features == _fresh(field) != expected
+        features.refresh = None
+        field.restore(snapshot)
+        assert features.features == expected
+        del features.refresh
+        IBlock.place(field, 0, 0, 1)
+        field.restore(before)
+        assert features.features == expected
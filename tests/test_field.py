@@ -1,5 +1,7 @@
 import pytest
 
+from blocked.bitfield import BitField
+from blocked.blocks import IBlock, OBlock
 from blocked.exceptions import GameOver
 from blocked.field import Field
 from blocked.score import ScoreKeeper
@@ -19,6 +21,27 @@ def test_from_str():
     assert str(with_solid_row) == '0,0,2;3,3,3'
 
 
+def test_from_bytes():
+    """the text can be read from a bytearray or memoryview"""
+    s = '0,0,0;0,1,1;2,0,2;3,3,3'
+    for data in (bytearray(s), memoryview(bytearray(s))):
+        assert Field.from_str(data) == Field.from_str(s)
+        assert str(Field.from_str(data)) == s
+
+
+def test_from_str_matches_cell_by_cell():
+    """fields read from text are the same as those read a cell at a time"""
+    for s in ('0', '0,0;0,0', '0,1,1,0;0,0,2,2;0,2,2,2;3,3,3,3',
+              '0,0;3,3;3,3'):
+        field, expected = Field.from_str(s), Field._from_cells(s)
+        assert field == expected
+        assert field.h == expected.h and field.w == expected.w
+        assert field.zobrist == expected.zobrist
+        assert str(field) == s
+    # Solid rows above others are raised as they are read
+    assert str(Field.from_str('0,0;3,3;0,2')) == '0,0;0,2;3,3'
+
+
 def test_row_completion():
     """update should delete any full rows and return the number removed"""
     score_keeper = ScoreKeeper()
@@ -58,3 +81,170 @@ def test_raising():
 
     assert score_keeper.score == 0
     assert score_keeper.combo == 0
+
+
+def test_raising_several_rows():
+    field = Field.from_str('0,0,0;0,0,0;0,0,0;0,2,0;3,3,3')
+    assert field.headroom == 3
+    field.raise_base(2)
+    assert str(field) == '0,0,0;0,2,0;3,3,3;3,3,3;3,3,3'
+    assert field.headroom == 1
+
+    # The base rises as far as it can before the game ends
+    with pytest.raises(GameOver):
+        field.raise_base(3)
+    assert str(field) == '0,2,0;3,3,3;3,3,3;3,3,3;3,3,3'
+    assert field.headroom == 0
+
+
+def test_snapshot_and_restore():
+    """restoring a snapshot undoes block moves, cleared rows and scoring,
+    and rows untouched since the snapshot stay shared"""
+    for field_cls in (Field, BitField):
+        field = field_cls.from_str('0,0,0,0;0,0,0,0;0,0,0,0;2,2,0,0',
+                                   ScoreKeeper(5, 1))
+        before = str(field)
+        snapshot = field.snapshot()
+        OBlock(field, (2, 0)).drop()
+        field.remove_completed_rows()
+        assert str(field) == '0,0,0,0;0,0,0,0;0,0,0,0;0,0,2,2'
+        assert (field.score, field.combo) == (7, 2)
+        field.restore(snapshot)
+        assert str(field) == before
+        assert (field.score, field.combo) == (5, 1)
+
+        snapshot = field.snapshot()
+        IBlock(field, (0, -1)).drop()
+        assert str(field) == '0,0,0,0;0,0,0,0;2,2,2,2;2,2,0,0'
+        # The block fell through the top row and landed in the third
+        assert [field.row(j) is snapshot.rows[j] for j in range(4)] == \
+            [False, True, False, True]
+        field.restore(snapshot)
+        assert str(field) == before
+
+
+def test_restore_undoes_written_cells():
+    """cells written straight into rows after a snapshot are undone by
+    restoring it"""
+    for field_cls in (Field, BitField):
+        field = field_cls.from_str('0,0,0;0,0,0;2,0,0')
+        snapshot = field.snapshot()
+        field[0][0] = 2
+        field[2][1] = 2
+        assert str(field) == '2,0,0;0,0,0;2,2,0'
+        field.restore(snapshot)
+        assert str(field) == '0,0,0;0,0,0;2,0,0'
+
+
+def test_copy():
+    """copies share rows but not changes"""
+    field = Field.from_str('0,0,0;0,0,0;0,0,0;2,0,0')
+    other = field.copy()
+    OBlock(other, (1, 1)).drop()
+    assert field.row(0) is other.row(0)
+    other.remove_completed_rows()
+    assert str(field) == '0,0,0;0,0,0;0,0,0;2,0,0'
+    assert str(other) == '0,0,0;0,0,0;0,0,0;0,2,2'
+    assert (field.score, other.score) == (0, 1)
+
+
+def test_copy_cells_written():
+    """cells written straight into the rows of a copy leave the original
+    as it was, and the other way round"""
+    for field_cls in (Field, BitField):
+        field = field_cls.from_str('0,0,0;0,0,0;0,0,0')
+        other = field.copy()
+        other[2][1] = 2
+        field[0][0] = 2
+        assert str(field) == '2,0,0;0,0,0;0,0,0'
+        assert str(other) == '0,0,0;0,0,0;0,2,0'
+
+
+def test_rows_reused():
+    """cleared rows are emptied and reused, rows of a snapshot are not"""
+    field = Field.from_str('0,0,0;0,0,2;2,2,2;0,2,0;2,2,2')
+    rows = set(id(field[j]) for j in range(5))
+    field.remove_completed_rows()
+    assert str(field) == '0,0,0;0,0,0;0,0,0;0,0,2;0,2,0'
+    assert set(id(field[j]) for j in range(5)) == rows
+
+    field.raise_base()
+    assert str(field) == '0,0,0;0,0,0;0,0,2;0,2,0;3,3,3'
+    assert field.row(4) is Field.from_str('0,0,0;3,3,3').row(1)
+
+    snapshot = field.snapshot()
+    for i in range(3):
+        field.writable_row(1)[i] = 2
+    field.remove_completed_rows()
+    field.restore(snapshot)
+    assert str(field) == '0,0,0;0,0,0;0,0,2;0,2,0;3,3,3'
+    for i in range(3):
+        field.writable_row(0)[i] = 2
+    field.remove_completed_rows()
+    assert str(field) == '0,0,0;0,0,0;0,0,2;0,2,0;3,3,3'
+    assert str(snapshot.rows[0]) == '0,0,0'
+
+
+def test_solid_rows_written():
+    """solid rows are shared between fields, but writing to one through a
+    field leaves the others as they were"""
+    for field_cls in (Field, BitField):
+        field = field_cls.from_str('0,0,0;3,3,3')
+        other = field_cls.from_str('0,0,0;3,3,3')
+        with pytest.raises(TypeError):
+            field.row(1)[0] = 0
+        field[1][0] = 0
+        assert str(field) == '0,0,0;0,3,3'
+        assert str(other) == '0,0,0;3,3,3'
+        assert str(field_cls.from_str('0,0,0;3,3,3')) == '0,0,0;3,3,3'
+
+
+def test_rows_out_of_bounds():
+    """rows above and below the field are kept rather than made on each
+    access, falling cells above the field are kept like any other"""
+    field = Field(3, 4)
+    assert field[-1] is field[-1]
+    assert field[3] is field[5] is Field(5, 4)[5]
+    assert field[3][0] > 1
+    with pytest.raises(IndexError):
+        field[3][0] = 1
+
+    block = IBlock(field, (0, -2))
+    assert [field[-1][i] for i in range(4)] == [1, 1, 1, 1]
+    block.try_move(0, 0)
+    assert [field[-1][i] for i in range(4)] == [0, 0, 0, 0]
+    assert field[-9] is field[-9]
+
+    field = Field.from_str('0,0;2,0')
+    with pytest.raises(GameOver):
+        OBlock(field, (0, -2)).drop()
+
+
+def test_snapshot_rows_above_field():
+    """cells above the field are captured by snapshots and copies"""
+    field = Field(3, 4)
+    IBlock(field, (0, -2))
+    snapshot = field.snapshot()
+    other = field.copy()
+    field[-1][0] = 0
+    assert [other[-1][i] for i in range(4)] == [1, 1, 1, 1]
+    field.restore(snapshot)
+    assert [field[-1][i] for i in range(4)] == [1, 1, 1, 1]
+    field[-1][0] = 0
+    field.restore(snapshot)
+    assert [field[-1][i] for i in range(4)] == [1, 1, 1, 1]
+
+
+def test_reading_far_above_field():
+    """rows above the field are only made when written to, however far up
+    they are read"""
+    field = Field(3, 4)
+    assert field.row(-200000).is_empty()
+    assert field.row(-200000) is Field(5, 4).row(-3)
+    with pytest.raises(TypeError):
+        field.row(-5)[0] = 1
+    assert len(field.snapshot().hidden) == 0
+    field[-2][1] = 1
+    assert field.row(-2)[1] == 1
+    assert field.row(-3)[1] == 0
+    assert len(field.snapshot().hidden) == 1
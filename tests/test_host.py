@@ -0,0 +1,91 @@
+import sys
+import time
+from collections import OrderedDict
+
+from blocked.host import Match, run_matches
+from blocked.instrument import Histogram, Instrumentation
+
+_settings = OrderedDict([
+    ('time_bank', 1000),
+    ('time_per_move', 100),
+    ('player_names', ('player1', 'player2')),
+    ('your_bot', 'player1'),
+    ('field_height', 8),
+    ('field_width', 10)
+])
+
+_BOT = '''
+import sys, time
+moves = 0
+while True:
+    line = sys.stdin.readline()
+    if not line:
+        break
+    if line.startswith('settings your_bot'):
+        sys.stderr.write(line)
+    if line.startswith('action'):
+        moves += 1
+        if moves > {slow_after}:
+            time.sleep(2)
+        if moves > {exit_after}:
+            break
+        sys.stdout.write('{answer}\\n')
+        sys.stdout.flush()
+'''
+
+
+def _bot(tmpdir, name, answer='drop', slow_after=1000, exit_after=1000):
+    path = tmpdir.join(name + '.py')
+    path.write(_BOT.format(answer=answer, slow_after=slow_after,
+                           exit_after=exit_after))
+    return [sys.executable, str(path)]
+
+
+def test_match(tmpdir):
+    left = _bot(tmpdir, 'left', 'left,left,left,drop')
+    right = _bot(tmpdir, 'right', 'right,right,bogus,right,drop')
+    result, = run_matches([Match((left, right), _settings, seed=1)])
+    assert result.winner in (0, 1, None)
+    assert result.rounds > 1
+    for records in result.moves:
+        assert [r.round for r in records] == range(1, result.rounds + 1)
+        assert all(0 <= r.time_bank <= 1000 for r in records)
+
+
+def test_time_out_loses(tmpdir):
+    slow = _bot(tmpdir, 'slow', slow_after=1)
+    fine = _bot(tmpdir, 'fine')
+    start = time.time()
+    result, = run_matches([Match((fine, slow), _settings, seed=2)])
+    assert time.time() - start < 1.9
+    assert result.winner == 0
+    assert result.rounds == 2
+    assert result.moves[1][-1].time_bank == 0
+
+
+def test_exit_loses(tmpdir):
+    quitter = _bot(tmpdir, 'quitter', exit_after=3)
+    fine = _bot(tmpdir, 'fine')
+    result, = run_matches([Match((quitter, fine), _settings, seed=3)])
+    assert result.winner == 1
+    assert result.rounds == 4
+
+
+def test_concurrent_matches(tmpdir):
+    """matches run side by side in one loop and depend only on their seed"""
+    bots = _bot(tmpdir, 'a', 'left,drop'), _bot(tmpdir, 'b')
+    first = run_matches([Match(bots, _settings, seed=s) for s in range(6)])
+    again = run_matches([Match(bots, _settings, seed=s) for s in range(6)])
+    assert [(r.winner, r.scores, r.rounds) for r in first] == \
+        [(r.winner, r.scores, r.rounds) for r in again]
+
+
+def test_instrumented_match(tmpdir):
+    histogram = Histogram()
+    bot = _bot(tmpdir, 'bot')
+    result, = run_matches([Match((bot, bot), _settings, seed=3,
+                                 instrumentation=Instrumentation(histogram))])
+    calls = dict((s.phase, s.calls) for s in histogram.summary())
+    assert calls['bot_response'] == 2 * result.rounds
+    assert calls['report'] == result.rounds
+    assert calls['complete_round'] == result.rounds - 1
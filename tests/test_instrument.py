@@ -0,0 +1,59 @@
+import json
+from cStringIO import StringIO
+
+from blocked.blocks import SequenceBlockSource
+from blocked.engine import Engine, GameState
+from blocked.field import Field
+from blocked.instrument import Instrumentation, Histogram, JsonLinesSink, \
+    ProfileSink
+
+
+def _engine(instrumentation):
+    fields = (Field.from_str('0,0,0,0;0,0,0,0;2,2,2,2;2,2,2,2;2,2,2,2;'
+                             '2,2,2,2'),
+              Field(6, 4))
+    game_state = GameState(SequenceBlockSource('OI', repeat=True))
+    return Engine(fields, ('p1', 'p2'), game_state=game_state,
+                  instrumentation=instrumentation)
+
+
+def test_engine_phases_and_counts():
+    histogram = Histogram()
+    lines = StringIO()
+    engine = _engine(Instrumentation(histogram, JsonLinesSink(lines)))
+    engine.complete_round()
+    engine.report_to(StringIO())
+
+    calls = dict((s.phase, s.calls) for s in histogram.summary())
+    assert calls == {'complete_round': 1, 'report_to': 1,
+                     'remove_completed_rows': 2, 'raise_base': 1}
+    assert dict(histogram.counts) == {'rows_cleared': 4, 'garbage_sent': 2}
+    assert str(engine.field2) == \
+        '0,0,0,0;0,0,0,0;0,0,0,0;0,0,0,0;3,3,3,3;3,3,3,3'
+
+    records = [json.loads(line) for line in lines.getvalue().splitlines()]
+    assert {'count': 'garbage_sent', 'n': 2} in records
+    assert [r['phase'] for r in records if 'phase' in r] == [
+        'remove_completed_rows', 'remove_completed_rows', 'raise_base',
+        'complete_round', 'report_to'
+    ]
+    summary = histogram.summary()[0]
+    assert summary.p50 <= summary.p99
+    assert summary.total >= summary.mean > 0
+
+
+def test_profile_sink():
+    sink = ProfileSink(phases=('raise_base',))
+    engine = _engine(Instrumentation(sink))
+    engine.complete_round()
+    output = StringIO()
+    sink.stats(output).print_stats()
+    assert 'raise_base' in output.getvalue()
+    assert 'remove_completed_rows' not in output.getvalue()
+
+
+def test_uninstrumented_engine_runs_plain_methods():
+    engine = _engine(None)
+    assert 'complete_round' not in vars(engine)
+    engine.complete_round()
+    assert engine.field1.score == 8
@@ -0,0 +1,116 @@
+import random
+
+import pytest
+
+from blocked.bitfield import BitField
+from blocked.blocks import BLOCKS, OBlock, IBlock, TBlock, SBlock
+from blocked.exceptions import GameOver, InvalidBlockPosition
+from blocked.field import Field
+from blocked.moves import placements, apply_moves, execute, compile_moves, \
+    Execution, MOVES, LEFT, RIGHT, TURN_LEFT, TURN_RIGHT, DOWN, DROP
+
+
+def _play(field, block_cls, position, moves):
+    block = block_cls(field, position)
+    for move in moves:
+        x, y = block.position
+        if move == LEFT:
+            block.position = x - 1, y
+        elif move == RIGHT:
+            block.position = x + 1, y
+        elif move == DOWN:
+            block.position = x, y + 1
+        elif move == TURN_LEFT:
+            block.rotate_ccw()
+        elif move == TURN_RIGHT:
+            block.rotate_cw()
+        elif move == DROP:
+            block.drop()
+    return block
+
+
+def test_empty_field_counts():
+    """symmetric rotations are only reported once"""
+    field = Field(20, 10)
+    counts = dict(
+        (b.type, len(placements(field, b, (4, -1)))) for b in BLOCKS.values()
+    )
+    assert counts == {
+        'O': 9, 'I': 17, 'S': 17, 'Z': 17, 'J': 34, 'L': 34, 'T': 34
+    }
+
+
+def test_moves_reach_placement():
+    s = ('0,0,0,0,0,0;0,0,0,0,0,0;0,0,0,0,0,0;0,0,0,0,0,0;'
+         '2,2,0,0,0,0;0,0,0,0,0,2;0,2,0,2,2,2;3,3,3,3,3,3')
+    for block_cls in (OBlock, IBlock, TBlock, SBlock):
+        for placement in placements(Field.from_str(s), block_cls, (2, -1)):
+            assert placement.moves[-1] == DROP
+            block = _play(Field.from_str(s), block_cls, (2, -1),
+                          placement.moves)
+            assert block.rotation == placement.rotation
+            assert block.position == (placement.x, placement.y)
+
+
+def test_tuck_under_overhang():
+    """placements only reachable by sliding sideways after moving down"""
+    field = Field.from_str('0,0,0,0;0,0,0,0;2,2,0,0;0,0,0,0;0,0,0,0')
+    found = [p for p in placements(field, OBlock, (2, -1)) if p.y == 3]
+    assert [(p.x, p.moves) for p in found] == [
+        (2, (DROP,)),
+        (1, (DOWN, DOWN, DOWN, DOWN, LEFT, DROP)),
+        (0, (DOWN, DOWN, DOWN, DOWN, LEFT, LEFT, DROP)),
+    ]
+
+
+def test_field_not_modified():
+    s = '0,0,0,0;0,0,0,0;0,2,0,0;2,2,0,2'
+    field = Field.from_str(s)
+    placements(field, TBlock, (1, -1))
+    assert str(field) == s
+
+
+def test_blocked_spawn():
+    field = Field.from_str('2,2,2,2;2,2,2,2')
+    assert placements(field, OBlock, (1, 0)) == []
+
+
+def test_execute_matches_apply_moves():
+    """executing moves fixes the block where moving a block would"""
+    rng = random.Random(4)
+    s = ('0,0,0,0,0,0;0,0,0,0,0,0;0,0,0,0,0,0;0,0,0,0,0,0;'
+         '2,2,0,0,0,0;0,0,0,0,0,2;0,2,0,2,2,2;3,3,3,3,3,3')
+    for _ in xrange(200):
+        block_cls = rng.choice(BLOCKS.values())
+        moves = [rng.choice(MOVES[:-1]) for _ in xrange(rng.randint(0, 12))]
+        if rng.random() < 0.3:
+            moves.insert(rng.randint(0, len(moves)), DROP)
+        for field_cls in (Field, BitField):
+            expected = field_cls.from_str(s)
+            block = block_cls(expected, (2, -1))
+            failed = apply_moves(block, moves)
+            field = field_cls.from_str(s)
+            result = execute(field, block_cls, (2, -1), ','.join(moves))
+            assert str(field) == str(expected)
+            assert (result.rotation, (result.x, result.y)) == \
+                (block.rotation, block.position)
+            assert result.failed == failed
+
+
+def test_execute_reports_first_failed():
+    field = Field.from_str('0,0,0,0;0,0,0,0;0,0,0,0;0,0,0,0')
+    assert execute(field, OBlock, (1, 0), 'left,left,right,drop,left') == \
+        Execution(0, 1, 2, 2, 1)
+    assert str(field) == '0,0,0,0;0,0,0,0;0,2,2,0;0,2,2,0'
+    # Text which is not a move is not made
+    assert execute(Field(4, 4), OBlock, (1, 0), 'left,jump, right') == \
+        Execution(0, 1, 2, 1, 1)
+    assert compile_moves('left,jump, right') == (0, -1, 1)
+    assert compile_moves(['drop']) == (5,)
+
+
+def test_execute_game_over():
+    with pytest.raises(InvalidBlockPosition):
+        execute(Field.from_str('2,2,2,2;2,2,2,2'), OBlock, (1, 0), 'drop')
+    with pytest.raises(GameOver):
+        execute(Field.from_str('0,0,0,0;2,2,2,2'), OBlock, (1, -1), 'drop')
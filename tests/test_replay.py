@@ -0,0 +1,125 @@
+import os
+import random
+
+import pytest
+
+from blocked.bitfield import BitField
+from blocked.blocks import default_block_source, OBlock
+from blocked.engine import Engine, GameState, _DEFAULT_SETTINGS
+from blocked.exceptions import GameOver
+from blocked.field import Field
+from blocked.moves import placements, apply_moves
+from blocked.replay import ReplayWriter, Replay
+from blocked.tournament import winner_index
+
+
+def _record_game(path, seed, snapshot_interval):
+    """Play a game of low random placements, recording it and returning the
+    field strings and blocks of each round"""
+    rng = random.Random(seed)
+    fields = Field(20, 10), Field(20, 10)
+    game_state = GameState(default_block_source(rng))
+    engine = Engine(fields, ('player1', 'player2'), _DEFAULT_SETTINGS,
+                    game_state)
+    history = []
+    with open(path, 'wb') as f:
+        writer = ReplayWriter(f, _DEFAULT_SETTINGS, fields,
+                              snapshot_interval=snapshot_interval)
+        result = None
+        while result is None:
+            history.append((tuple(str(f) for f in fields),
+                            tuple((f.score, f.combo) for f in fields),
+                            game_state.current_block))
+            block_cls = game_state.current_block
+            chosen, over = [], [False, False]
+            for p, field in enumerate(fields):
+                options = placements(field, block_cls,
+                                     game_state.block_position)
+                if not options:
+                    chosen.append(None)
+                    over[p] = True
+                    continue
+                options.sort(key=lambda o: -o.y)
+                placement = rng.choice(options[:3])
+                chosen.append(placement[:3])
+                try:
+                    apply_moves(block_cls(field, game_state.block_position),
+                                placement.moves)
+                except GameOver:
+                    over[p] = True
+            if any(over):
+                result = engine._determine_winner(*over)
+                writer.record_round(block_cls, chosen)
+                break
+            try:
+                engine.complete_round()
+            except GameOver as e:
+                result = e
+            writer.record_round(block_cls, chosen)
+        writer.finish(winner_index(result))
+    return history, winner_index(result)
+
+
+@pytest.mark.parametrize('interval', [1, 5, 16])
+def test_replay_seek(tmpdir, interval):
+    path = str(tmpdir.join('game.replay'))
+    history, winner = _record_game(path, 11, interval)
+    replay = Replay(path)
+    assert replay.settings == _DEFAULT_SETTINGS
+    assert replay.finished
+    assert replay.winner == winner
+    assert replay.rounds == len(history)
+
+    rounds = range(1, replay.rounds + 1)
+    random.Random(0).shuffle(rounds)
+    for r in rounds:
+        strings, scores, block_cls = history[r - 1]
+        assert replay.block(r) is block_cls
+        fields = replay.fields(r)
+        assert tuple(str(f) for f in fields) == strings
+        assert tuple((f.score, f.combo) for f in fields) == scores
+    assert str(replay.fields(len(history), BitField)[0]) == history[-1][0][0]
+    replay.close()
+
+
+def test_replay_is_compact(tmpdir):
+    path = str(tmpdir.join('game.replay'))
+    history, _ = _record_game(path, 5, 16)
+    text_size = sum(len(s[0][0]) + len(s[0][1]) for s in history)
+    assert os.path.getsize(path) * 10 < text_size
+
+
+def test_unfinished_replay(tmpdir):
+    path = str(tmpdir.join('game.replay'))
+    fields = Field(4, 4), Field(4, 4)
+    with open(path, 'wb') as f:
+        writer = ReplayWriter(f, _DEFAULT_SETTINGS, fields,
+                              snapshot_interval=2)
+        OBlock(fields[0], (0, 2)).drop()
+        OBlock(fields[1], (2, 2)).drop()
+        writer.record_round(OBlock, [(0, 0, 2), (0, 2, 2)])
+    replay = Replay(path)
+    assert not replay.finished
+    assert replay.rounds == 1
+    assert replay.placements(1) == ((0, 0, 2), (0, 2, 2))
+    with pytest.raises(IndexError):
+        replay.fields(2)
+    assert [str(f) for f in replay.fields(1)] == \
+        ['0,0,0,0;0,0,0,0;0,0,0,0;0,0,0,0'] * 2
+
+
+def test_tie_recorded(tmpdir):
+    path = str(tmpdir.join('game.replay'))
+    fields = Field(4, 4), Field(4, 4)
+    with open(path, 'wb') as f:
+        ReplayWriter(f, _DEFAULT_SETTINGS, fields).finish(None)
+    replay = Replay(path)
+    assert replay.finished and replay.winner is None and replay.rounds == 0
+
+
+def test_field_size_limits(tmpdir):
+    """fields whose placements cannot be packed are refused"""
+    for h, w in ((4, 60), (252, 4)):
+        with open(str(tmpdir.join('replay')), 'wb') as f:
+            with pytest.raises(ValueError):
+                ReplayWriter(f, _DEFAULT_SETTINGS, (Field(h, w), Field(h, w)))
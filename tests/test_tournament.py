@@ -0,0 +1,88 @@
+from blocked.moves import placements
+from blocked.tournament import Tournament, GameSpec, GameResult, play_game, \
+    round_robin, swiss_pairings, standings
+
+DROP_BOT = 'tests.test_tournament:DropBot'
+LOW_BOT = 'tests.test_tournament:LowBot'
+
+
+class DropBot(object):
+    """drops every block where it appears"""
+
+    def action(self, field, opponent_field, game_state):
+        return []
+
+
+class LowBot(object):
+    """places every block as low as it can go"""
+
+    def action(self, field, opponent_field, game_state):
+        options = placements(field, game_state.current_block,
+                             game_state.block_position)
+        return max(options, key=lambda p: (p.y, -p.x)).moves
+
+
+def test_play_game_deterministic():
+    spec = GameSpec('g', (LOW_BOT, DROP_BOT), 7)
+    result = play_game(spec)
+    assert result == play_game(spec)
+    assert result.winner == 0
+    assert result.rounds > 1
+
+
+def test_round_robin_schedule():
+    specs = list(round_robin(['a', 'b', 'c'], 2, seed=1))
+    assert len(specs) == 12
+    assert len(set(s.game_id for s in specs)) == 12
+    assert specs == list(round_robin(['a', 'b', 'c'], 2, seed=1))
+    assert specs != list(round_robin(['a', 'b', 'c'], 2, seed=2))
+
+
+def test_swiss_pairings():
+    bots = ['a', 'b', 'c', 'd', 'e']
+    first = list(swiss_pairings(bots, [], 0, seed=0))
+    assert len(first) == 2
+    results = [GameResult(s.game_id, s.players, s.seed, 0, (0, 0), 1)
+               for s in first]
+    second = list(swiss_pairings(bots, results, 1, seed=0))
+    played = set(frozenset(s.players) for s in first)
+    assert not played & set(frozenset(s.players) for s in second)
+    # the bot with a bye in the first round plays in the second
+    assert 'e' in set(p for s in second for p in s.players)
+
+
+def test_standings():
+    results = [
+        GameResult('1', ('a', 'b'), 0, 0, (5, 1), 10),
+        GameResult('2', ('b', 'a'), 0, None, (2, 2), 12),
+    ]
+    table = standings(['a', 'b'], results)
+    assert [(s.bot, s.wins, s.losses, s.ties, s.score, s.rounds)
+            for s in table] == [('a', 1, 0, 1, 7, 22), ('b', 0, 1, 1, 3, 22)]
+
+
+def test_tournament_resumes(tmpdir):
+    path = str(tmpdir.join('results.jsonl'))
+    tournament = Tournament([LOW_BOT, DROP_BOT], path, seed=3, processes=2)
+    table = tournament.round_robin(games_per_pair=2)
+    assert table[0].bot == LOW_BOT
+    assert table[0].wins == 4
+
+    lines = open(path).readlines()
+    assert len(lines) == 4
+    # drop one result and leave a partly written line, as after a crash
+    with open(path, 'w') as f:
+        f.writelines(lines[:3])
+        f.write(lines[3][:10])
+
+    resumed = Tournament([LOW_BOT, DROP_BOT], path, seed=3, processes=2)
+    assert len(resumed.results) == 3
+    assert resumed.round_robin(games_per_pair=2) == table
+    assert sorted(open(path).readlines()) == sorted(lines)
+
+
+def test_swiss_tournament(tmpdir):
+    path = str(tmpdir.join('swiss.jsonl'))
+    tournament = Tournament([LOW_BOT, DROP_BOT], path, seed=1, processes=2)
+    table = tournament.swiss(rounds=2)
+    assert sum(s.games for s in table) == 4
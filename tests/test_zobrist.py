@@ -0,0 +1,118 @@
+import random
+
+import pytest
+
+from blocked.ai import SearchBot
+from blocked.bitfield import BitField
+from blocked.blocks import UniformBlockSource
+from blocked.engine import Engine, GameState
+from blocked.exceptions import GameOver
+from blocked.field import Field
+from blocked.moves import placements, apply_moves
+from blocked.zobrist import LRUTable, DepthPreferredTable, \
+    TranspositionTable
+
+
+def test_hash_follows_cells():
+    """the hash kept up through play is the hash of the cells"""
+    for field_cls in (Field, BitField):
+        rng = random.Random(2)
+        fields = field_cls(12, 6), field_cls(12, 6)
+        game_state = GameState(UniformBlockSource(5))
+        game_state.block_position = 2, -1
+        engine = Engine(fields, ('p1', 'p2'), game_state=game_state)
+        seen = {}
+        try:
+            for _ in range(100):
+                block_cls = game_state.current_block
+                for field in fields:
+                    options = placements(field, block_cls,
+                                         game_state.block_position)
+                    if not options:
+                        raise GameOver()
+                    options.sort(key=lambda o: -o.y)
+                    apply_moves(block_cls(field, game_state.block_position),
+                                rng.choice(options[:3]).moves)
+                engine.complete_round()
+                for field in fields:
+                    fresh = Field.from_str(str(field))
+                    assert field.zobrist == fresh.zobrist
+                    assert field == fresh
+                    assert seen.setdefault(field.zobrist, str(field)) == \
+                        str(field)
+        except GameOver:
+            pass
+        assert game_state.round > 10
+
+
+def test_equality():
+    field = Field.from_str('0,0,0;0,0,0;0,2,0;3,3,3')
+    assert field == BitField.from_str('0,0,0;0,0,0;0,2,0;3,3,3')
+    assert field != Field.from_str('0,0,0;0,0,0;0,0,2;3,3,3')
+    assert field != Field.from_str('0,0,0;0,2,0;0,0,0;3,3,3')
+    assert field != Field.from_str('0,0,0;0,0,0;0,2,0;0,0,0')
+    assert len(set([field, Field.from_str(str(field))])) == 1
+
+    before = field.zobrist
+    snapshot = field.snapshot()
+    field.raise_base()
+    assert field.zobrist != before
+    assert field.zobrist == Field.from_str('0,0,0;0,2,0;3,3,3;3,3,3').zobrist
+    field.restore(snapshot)
+    assert field.zobrist == before
+
+
+def test_lru_table():
+    table = LRUTable(2)
+    table.put('a', 1)
+    table.put('b', 2)
+    assert table.get('a') == 1
+    table.put('c', 3)
+    assert table.get('b') is None
+    assert table.get('a') == 1
+    assert table.get('c', depth=1) is None
+    stats = table.stats
+    assert (stats.entries, stats.hits, stats.misses, stats.evictions) == \
+        (2, 2, 2, 1)
+    assert stats.hit_rate == 0.5
+    assert stats.memory > 0
+
+
+def test_depth_preferred_table():
+    table = DepthPreferredTable(1)
+    table.put('a', 1, depth=2)
+    table.put('b', 2, depth=1)
+    assert table.get('b') is None
+    assert table.get('a', depth=2) == 1
+    assert table.get('a', depth=3) is None
+    table.put('b', 2, depth=3)
+    assert table.get('a') is None
+    assert table.get('b', depth=3) == 2
+    assert table.stats.evictions == 1
+    assert len(table) == 1
+
+
+def test_table_needs_storage():
+    """tables must say how they store and evict entries"""
+    class Incomplete(TranspositionTable):
+        def _lookup(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_search_with_table():
+    field = Field.from_str(';'.join(['0,0,0,0,0,0'] * 6 + ['2,0,2,2,0,2']))
+    game_state = GameState(UniformBlockSource(1))
+    game_state.block_position = 2, -1
+    table = LRUTable()
+    cached = SearchBot(time_per_move=10000, max_depth=3, table=table)
+    plain = SearchBot(time_per_move=10000, max_depth=3)
+    moves = plain.action(field, field, game_state)
+    assert cached.action(field, field, game_state) == moves
+    assert table.stats.hits == 0
+    # Searching the same position again finds the values of its placements
+    assert cached.action(field, field, game_state) == moves
+    assert table.stats.hits > 0
+    assert cached.stats[1].nodes < plain.stats[0].nodes